@@ -40,20 +40,20 @@ from typing import Callable
 
 import numpy as np
 from loguru import logger
-from srpc import connect, loads
-from zee import FixedDict, flatten_dict
+from srpc import connect
 
 from . import _dp as dp
+from ._cache import ResultCache
 from ._db import get_tid_by_rid
 from ._recipe import Recipe
-from ._task import Task
+from ._task import Task, TaskGroup
 
 
 class Super(object):
     """Super Admin Tool to interact with `QuarkServer` and database and so on"""
 
     def __init__(self):
-        self.__cache = FixedDict(maxlen=128)
+        self.__cache = ResultCache()
 
     def init(self, path: str | Path = Path.cwd() / 'quark.json'):
         """Set path to `quark.json`
@@ -135,11 +135,48 @@ class Super(object):
             preview (list): real time display of the waveform
             plot (bool): plot the result if True(1D or 2D), defaults to False.
             backend (connection): connection to a backend, defaults to local machine.
+            delta (bool): send the base as a delta against the last submitted one, defaults to False.
         Raises:
             TypeError: _description_
         """
         return submit(task, block, **kwds)
 
+    def submit_many(self, tasks: list[dict], **kwds) -> list[Task]:
+        """Submit many tasks in one request, fields shared by the tasks(base, lib, loops, ...) are sent only once
+
+        Args:
+            tasks (list[dict]): descriptions of tasks generated by `Recipe`
+
+        Keyword Arguments: Kwds
+            preview (list): real time display of the waveform
+            plot (bool): plot the result if True(1D or 2D), defaults to False.
+            backend (connection): connection to a backend, defaults to local machine.
+
+        Returns:
+            list[Task]: tasks submitted, in the same order
+        """
+        return submit_many(tasks, **kwds)
+
+    def adaptive(self, task: dict, groups: list[str] = [], npoints: int = 16, rounds: int = 8, goal: float = 0.0, **kwds) -> dict:
+        """Sweep the grid of a task adaptively, points are refined where the signal changes the most
+
+        Args:
+            task (dict): description of a task generated by `Recipe`, the grid of the swept groups is the domain.
+            groups (list[str], optional): swept groups, 1 or 2. Defaults to the first group.
+            npoints (int, optional): number of points per round. Defaults to 16.
+            rounds (int, optional): maximum number of rounds. Defaults to 8.
+            goal (float, optional): stop if the loss is below it. Defaults to 0.0.
+
+        Keyword Arguments: Kwds
+            reduce (Callable): scalar of a point used to choose the next points, defaults to mean of abs.
+            submit (Callable): submit a task and return its `Task`, defaults to `s.submit`.
+
+        Returns:
+            dict: index, coords, value, data of the sampled points and tids of the rounds
+        """
+        from ._adaptive import adaptive
+        return adaptive(task, groups, npoints, rounds, goal, **kwds)
+
     def ping(self, srv=None):
         return ping(srv or self.qs())
 
@@ -176,6 +213,62 @@ class Super(object):
         else:
             return self.qs().snapshot(tid=self.getid(idx) if idx else idx)
 
+    def status(self, tid: int) -> str | None:
+        """Status of a task, results are cached only if it is done
+
+        Args:
+            tid (int): task id
+
+        Returns:
+            str | None: status
+        """
+        try:
+            if self.addr[0] == '127.0.0.1':
+                from ._db import get_record_by_tid
+                return get_record_by_tid(tid)[6]
+            else:
+                return self.qs().track(tid)['status']
+        except Exception as e:
+            logger.warning(f'Failed to get status of {tid}: {e}')
+
+    def parameter(self, path: str, ids: list[int]) -> dict:
+        """Get a parameter from the snapshots of many tasks with given ids(**tid** or **rid**)
+
+        Args:
+            path (str): dot-separated keys like 'Q0.Measure.frequency'
+            ids (list[int]): tids or rids
+
+        Returns:
+            dict: {idx: value}, None if not found
+        """
+        tids = {idx: self.getid(idx) for idx in ids}
+        if self.addr[0] == '127.0.0.1':
+            from ._snapshot import store
+            values = store.query(path, list(set(tids.values())))
+        else:
+            from ._snapshot import lookup
+            values = {}
+            for tid in set(tids.values()):
+                try:
+                    values[tid] = lookup(self.qs().snapshot(tid=tid), path)
+                except Exception as e:
+                    values[tid] = None
+        return {idx: values[tid] for idx, tid in tids.items()}
+
+    def history(self, path: str, start: str = '', end: str = '') -> np.ndarray:
+        """History of a parameter over the records(local only), see `HistoryIndex`
+
+        Args:
+            path (str): dot-separated keys like 'Q0.Measure.frequency'
+            start (str, optional): start date. Defaults to ''.
+            end (str, optional): end date. Defaults to ''.
+
+        Returns:
+            np.ndarray: structured array with fields tid, created and value
+        """
+        from ._snapshot import index
+        return index.history(path, start, end)
+
     def rollback(self, idx: int):
         """Rollback the cfg with given idx(**tid** or **rid**)
 
@@ -197,6 +290,7 @@ class Super(object):
 
         Keyword Arguments: Kwds
             plot (bool, optional): plot the result in QuarkStudio after the data is loaded(1D or 2D).
+            lazy (bool, optional): return array-like proxies which read data on indexing(local only).
 
         Returns:
             dict: data & meta
@@ -205,14 +299,14 @@ class Super(object):
             self.__cache.clear()
             logger.info('Cache cleared.')
 
-        if idx in self.__cache:
-            # logger.info(f'Cache hit: {idx}')
-            r = self.__cache[idx]
-        else:
+        tid = self.getid(idx)
+        if kwds.get('lazy', False) and self.addr[0] == '127.0.0.1':
+            r = get_data_by_tid(tid, **kwds)
+        elif (r := self.__cache.get(tid)) is None:
             if self.addr[0] == '127.0.0.1':
-                r = get_data_by_tid(self.getid(idx), **kwds)
+                r = get_data_by_tid(tid, **kwds)
             else:
-                r = self.qs().load(self.getid(idx))
+                r = self.qs().load(tid)
                 try:
                     from ._db import reshape
 
@@ -221,26 +315,76 @@ class Super(object):
                                  for k, v in r['data'].items()}
                 except Exception as e:
                     logger.error(f'Failed to reshape data: {e}')
-            self.__cache[idx] = r
+            self.__cache.put(tid, r, self.status(tid))
 
         if task:
             return r.get('task', {})
         else:
             return {'data': r['data'], 'meta': r['meta']}
 
-    def lookup(self, start: str = '', end: str = '', name: str = ''):
-        """Lookup records in the database
+    def results(self, ids: list[int], workers: int = 4, **kwds):
+        """Get data of many tasks with given ids(**tid** or **rid**)
+
+        Records are resolved in one query and each data file is opened only once. 
+        Files are read concurrently and results are yielded as soon as they are loaded, 
+        so only a few of them are kept in memory.
+
+        Args:
+            ids (list[int]): tids or rids
+            workers (int, optional): number of threads. Defaults to 4.
+
+        Keyword Arguments: Kwds
+            lazy (bool, optional): return array-like proxies which read data on indexing(local only).
+
+        Yields:
+            tuple: idx & result(data & meta), **not** in the order of ids
+        """
+        if self.addr[0] == '127.0.0.1':
+            results = get_data_by_ids(ids, workers, self.__cache, kwds.get('lazy', False))
+        else:
+            results = ((idx, self.result(idx)) for idx in ids)
+
+        for idx, r in results:
+            yield idx, {'data': r['data'], 'meta': r['meta']}
+
+    def export(self, root: str | Path, ids: list[int] = [], params: list[str] = [], **filters) -> list[int]:
+        """Export records to a parquet dataset partitioned by name and date(local only, pyarrow required)
+
+        Args:
+            root (str | Path): directory of the dataset
+            ids (list[int], optional): tids or rids. Defaults to [].
+            params (list[str], optional): parameters in the snapshot to be included, e.g. 'Q0.Measure.frequency'. Defaults to [].
+
+        Keyword Arguments: Filters
+            name (str): task name, used if no ids given
+            start (str): start date
+            end (str): end date
+            tids (tuple): range of tid, (first, last)
+
+        Returns:
+            list[int]: tids exported
+        """
+        from ._export import export
+        return export(root, ids, params, **filters)
+
+    def lookup(self, start: str = '', end: str = '', name: str = '', status: str = '', user: str = '',
+               size: int = 100, after: int | None = None):
+        """Lookup records in the database, newest first
 
         Args:
             start (str, optional): start date. Defaults to ''.
             end (str, optional): end date. Defaults to ''.
             name (str, optional): task name. Defaults to ''.
+            status (str, optional): task status. Defaults to ''.
+            user (str, optional): user name. Defaults to ''.
+            size (int, optional): page size. Defaults to 100.
+            after (int | None, optional): cursor of the page, i.e. `df.attrs['cursor']` of the previous page. Defaults to None.
 
         Returns:
-            _type_: _description_
+            DataFrame: one page of records, `df.attrs['cursor']` is None if it is the last page
         """
         if self.addr[0] == '127.0.0.1':
-            return lookup(start, end, name)
+            return lookup(start, end, name, status=status, user=user, size=size, after=after)
         else:
             return lookup(records=self.qs().load(0))
 
@@ -421,11 +565,12 @@ class Super(object):
                     logger.error(f"Device {d}({target}) not in device list")
         return result
 
-    def diff(self, new: int | dict | str, old: int | dict | str, fmt: str = 'dict', ignore: list[str] = ['unit', 'sid'], **kwds):
+    def diff(self, new: int | dict | str | list, old: int | dict | str, fmt: str = 'dict', ignore: list[str] = ['unit', 'sid'], **kwds):
         """Compare two snapshots or records
 
         Args:
-            new (int | dict | str): new snapshot or record id or dict or filepath or text
+            new (int | dict | str | list): new snapshot or record id or dict or filepath or text. 
+                A list of them is compared against **old** one by one.
             old (int | dict | str): old snapshot or record id or dict or filepath or text
             fmt (str, optional): format of the output. Defaults to 'dict'.
             ignore (list[str], optional): keys to be ignored. Defaults to ['unit', 'sid'].
@@ -562,10 +707,46 @@ def submit(task: dict, block: bool = False, **kwds):
              timeout=1e9 if block else None,
              plot=kwds.get('plot', False))
     t.server = qs
-    t.run()
+    t.run(kwds.get('delta', False))
     return t
 
 
+def submit_many(tasks: list[dict], **kwds) -> list[Task]:
+    from ._snapshot import pack
+
+    if 'backend' in kwds:  # from master
+        qs = kwds['backend']
+    else:
+        qs = s.qs()
+
+        # waveforms to be previewed
+        qs.update('etc.canvas.filter', kwds.get('preview', []))
+
+    handles = []
+    for task in tasks:
+        t = Task(task, plot=kwds.get('plot', False))
+        t.server = qs
+        t.stime = time.time()
+        handles.append(t)
+
+    try:
+        # server resolves {'$ref': hexdigest} with refs
+        tids = qs.submit_many(*pack(tasks))
+    except AttributeError as e:  # unknown method
+        tids = f'AttributeError: {e}'
+
+    if isinstance(tids, str) and tids.startswith(('AttributeError', 'NotImplementedError')):
+        # nothing submitted, otherwise the tasks would run twice
+        logger.debug(f'submit_many not supported({tids}), submitting one by one')
+        tids = [qs.submit(task) for task in tasks]
+    elif not isinstance(tids, list) or len(tids) != len(tasks):
+        raise RuntimeError(f'Failed to submit_many: {tids}')
+
+    for t, tid in zip(handles, tids):
+        t.tid = tid
+    return handles
+
+
 @recommended(replacement='s.rollback')
 def rollback(idx: int):
     qs = s.qs()
@@ -583,34 +764,28 @@ def rollback(idx: int):
 
 
 @recommended(replacement='s.diff')
-def diff(new: int | dict, old: int | dict, fmt: str = 'dict', ignore: list[str] = ['unit', 'sid']):
+def diff(new: int | dict | list, old: int | dict, fmt: str = 'dict', ignore: list[str] = ['unit', 'sid']):
 
     if fmt == 'dict':
-        fda = flatten_dict(get_config_by_rid(
-            new) if isinstance(new, int) else new)
-        fdb = flatten_dict(get_config_by_rid(
-            old) if isinstance(old, int) else old)
-        changes = {}
-        for k in set(fda) | set(fdb):
-            if any(s in k for s in ignore):
-                continue
-
-            if k in fda and k in fdb:
-                try:
-                    if isinstance(fda[k], np.ndarray) and isinstance(fdb[k], np.ndarray):
-                        if not np.all(fda[k] == fdb[k]):
-                            changes[k] = f'{fdb[k]}\r\n->{" ":<{len(k)}}{fda[k]}'
-                    elif fda[k] != fdb[k]:
-                        changes[k] = f'{fdb[k]}\r\n->{" ":<{len(k)}}{fda[k]}'
-                except Exception as e:
-                    print(e)
-                    changes[k] = f'{fdb[k]}\r\n->{" ":<{len(k)}}{fda[k]}'
-            elif k in fda and k not in fdb:
-                changes[k] = f'🆕\r\n->{" ":<{len(k)}}{fda[k]}'
-            elif k not in fda and k in fdb:
-                changes[k] = f'{fdb[k]}\r\n->{" ":<{len(k)}}🗑️'
-
-        return changes
+        from collections import ChainMap
+
+        from ._snapshot import store
+
+        def snapshot(idx: int | dict):
+            if not isinstance(idx, int):
+                return idx
+            try:
+                return store.snapshot(get_tid_by_rid(idx))
+            except Exception as e:
+                logger.error(f'Failed to get config for {idx}: {e}')
+                return {}
+
+        memo = ChainMap({}, store.memo)  # digests of the base are computed only once
+        if isinstance(new, (list, tuple)):  # many records against one, keyed by id or position
+            base = snapshot(old)
+            return {idx if isinstance(idx, int) else i: _diff(snapshot(idx), base, ignore, memo)
+                    for i, idx in enumerate(new)}
+        return _diff(snapshot(new), snapshot(old), ignore, memo)
     elif fmt == 'git':
         from ._db import get_commit_by_tid
         assert isinstance(new, int), 'argument must be an integer'
@@ -627,30 +802,48 @@ def diff(new: int | dict, old: int | dict, fmt: str = 'dict', ignore: list[str]
         return msg
 
 
+def _diff(new: dict, old: dict, ignore: list[str], memo: dict) -> dict:
+    from ._snapshot import MISSING, changes
+
+    result = {}
+    for k, b, a in changes(new, old, ignore, memo):
+        if b is MISSING:
+            result[k] = f'🆕\r\n->{" ":<{len(k)}}{a}'
+        elif a is MISSING:
+            result[k] = f'{b}\r\n->{" ":<{len(k)}}🗑️'
+        else:
+            result[k] = f'{b}\r\n->{" ":<{len(k)}}{a}'
+    return result
+
+
 @recommended(replacement='s.lookup')
-def lookup(start: str = '', end: str = '', name: str = '', fmt: str = '%Y-%m-%d %H:%M:%S', records: list = []):
+def lookup(start: str = '', end: str = '', name: str = '', fmt: str = '%Y-%m-%d %H:%M:%S', records: list = [],
+           status: str = '', user: str = '', size: int = 100, after: int | None = None):
     import itables
     import pandas as pd
 
-    from ._db import get_record_list_by_name
+    from ._db import get_record_page
     from ._viewer import PagedTable
 
     itables.init_notebook_mode()
     itables.options.style = "width:100%"  # 让表格宽度为100%
 
+    columns = ['rid', 'tid', 'name', 'status', 'created', 'finished']
+    cursor = None
     if not records:
         days = time.localtime(time.time() - 14 * 24 * 60 * 60)
         start = time.strftime(fmt, days) if not start else start
         end = time.strftime(fmt) if not end else end
-        rs = get_record_list_by_name(name, start, end)[::-1]
-    else:
-        rs = records
+        rs, cursor = get_record_page(('id', 'tid', 'name', 'status', 'created', 'finished'), size, after,
+                                     name=name, status=status, user=user, start=start, end=end)
 
     try:
-        df = pd.DataFrame(rs)[[0, 1, 2, 6, 9, 10]]
-        df.columns = ['rid', 'tid', 'name', 'status', 'created', 'finished']
+        if records:  # full rows from the server
+            rs = [[r[i] for i in [0, 1, 2, 6, 9, 10]] for r in records]
+        df = pd.DataFrame(rs, columns=columns)
+        df.attrs['cursor'] = cursor
     except Exception as e:
-        # logger.error(f'Failed to get records: {e}')
+        logger.error(f'Failed to get records: {e}')
         return pd.DataFrame()
 
     # paged_table = PagedTable(df, page_size=10)
@@ -720,11 +913,11 @@ def get_config_by_rid(rid: int):
 @recommended(replacement='s.snapshot')
 def get_config_by_tid(tid: int) -> dict:
     # git config --global --add safe.directory path/to/cfg
-    from ._db import get_commit_by_tid
-    try:
-        commit, file = get_commit_by_tid(tid)
+    from copy import deepcopy
 
-        return loads(commit.tree[file.name].data_stream.read().decode())
+    from ._snapshot import store
+    try:
+        return deepcopy(store.snapshot(tid))
     except Exception as e:
         logger.error(f'Failed to get config for {tid}: {e}')
         return {}
@@ -745,7 +938,7 @@ def get_data_by_tid(tid: int, **kwds) -> dict:
         # Windows: OSError: [Errno 0] Unable to synchronously open file (unable to lock file, errno = 0, error message = 'No error', Win32 GetLastError() = 33)
         # MacOSX: BlockingIOError: [Errno 35] Unable to synchronously open file (unable to lock file, errno = 35, error message = 'Resource Temporarily unavailable')
         try:
-            info, data = get_dataset_by_tid(tid)
+            info, data = get_dataset_by_tid(tid, lazy=kwds.get('lazy', False))
             break
         except Exception as e:
             logger.error(str(e))
@@ -763,6 +956,74 @@ def get_data_by_tid(tid: int, **kwds) -> dict:
     return {'data': data, 'meta': info['meta'], 'task': info['task']}
 
 
+def get_data_by_ids(ids: list[int], workers: int = 4, cache: ResultCache | None = None, lazy: bool = False):
+    from concurrent.futures import ThreadPoolExecutor
+    from queue import Full, Queue
+    from threading import Event
+
+    from quark.proxy import HOME
+
+    from ._db import (get_datasets_by_file, get_record_list_by_rids,
+                      get_record_list_by_tids)
+
+    tids = {r[0]: int(r[1]) for r in get_record_list_by_rids([i for i in ids if i < 1e10])}
+    records = {int(r[1]): r for r in get_record_list_by_tids(list({tids.get(i, i) for i in ids}))}
+
+    files = defaultdict(lambda: defaultdict(list))  # filename -> dataset -> [(idx, tid, status)]
+    for idx in ids:
+        tid = tids.get(idx, idx)
+        if tid not in records:
+            logger.error(f'Record {idx} not found!')
+            continue
+        record = records[tid]
+        if not lazy and cache is not None and (r := cache.get(tid)) is not None:
+            yield idx, r
+            continue
+        files[str(HOME / f'dat/{Path(record[7]).name}')][record[8]].append((idx, tid, record[6]))
+
+    queue, stop = Queue(maxsize=workers), Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                return queue.put(item, timeout=0.5)
+            except Full:
+                continue
+
+    def load(filename: str, datasets: dict):
+        pending = dict(datasets)
+        for retry in range(3):
+            try:
+                for dataset, info, data in get_datasets_by_file(filename, list(pending), lazy):
+                    r = info and {'data': data, 'meta': info['meta'], 'task': info.get('task', {})}
+                    put((pending.pop(dataset), r))
+                break
+            except Exception as e:
+                # see get_data_by_tid for errors of locked files
+                logger.error(f'Failed to load {filename}: {e}')
+                time.sleep(1)
+        for items in pending.values():
+            put((items, None))
+
+    total = sum(len(datasets) for datasets in files.values())
+    pool = ThreadPoolExecutor(workers)
+    try:
+        for filename, datasets in files.items():
+            pool.submit(load, filename, datasets)
+
+        for _ in range(total):
+            items, r = queue.get()
+            if r is None:
+                continue
+            for idx, tid, status in items:
+                if cache is not None and not lazy:
+                    cache.put(tid, r, status)
+                yield idx, r
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 def update_dev_from_remote(host: str = '172.26.1.23'):
     info = s.remote(host).info()
     for alias, value in info.items():
@@ -0,0 +1,305 @@
+# MIT License
+
+# Copyright (c) 2021 YL Feng <fengyulong@pku.org.cn>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import heapq
+from copy import deepcopy
+from typing import Callable
+
+import numpy as np
+from loguru import logger
+
+from ._recipe import compile_rules, expand
+
+
+class Learner1D(object):
+    """Sample a 1D function where it changes the most
+
+    The loss of an interval is its length in the (normalized) x-y plane plus the area of the
+    triangles formed with its neighbours, so flat baselines are sampled sparsely while
+    peaks and edges are refined.
+
+    ***Example***
+    >>> learner = Learner1D((0, 100))
+    >>> while learner.loss() > 0.01:
+    ...     xs = learner.ask(10)
+    ...     learner.tell_many(xs, [f(x) for x in xs])
+    """
+
+    def __init__(self, bounds: tuple[float, float], curvature: float = 1.0, resolution: float = 0.0):
+        """
+        Args:
+            bounds (tuple[float, float]): range of x
+            curvature (float, optional): weight of the curvature term of the loss. Defaults to 1.0.
+            resolution (float, optional): minimum length of the intervals after splitting. Defaults to 0.0.
+        """
+        self.bounds = tuple(bounds)
+        self.curvature = curvature
+        self.resolution = resolution
+        self.data: dict[float, float] = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def tell(self, x: float, y: float):
+        self.data[x] = y
+
+    def tell_many(self, xs: list[float], ys: list[float]):
+        for x, y in zip(xs, ys):
+            self.tell(x, y)
+
+    def points(self):
+        """sampled points sorted by x, normalized to [0, 1]"""
+        x = np.array(sorted(self.data), float)
+        y = np.array([self.data[k] for k in x], float)
+        scale = np.ptp(y) if len(y) and np.ptp(y) > 0 else 1
+        return (x - self.bounds[0]) / (self.bounds[1] - self.bounds[0]), (y - np.min(y, initial=0)) / scale
+
+    def losses(self) -> np.ndarray:
+        """loss of each interval between neighbouring points"""
+        x, y = self.points()
+        dx, dy = np.diff(x), np.diff(y)
+        loss = np.hypot(dx, dy)
+        if self.curvature and len(x) > 2:
+            # area of the triangle formed by 3 neighbouring points, shared by 2 intervals
+            area = np.abs(dx[:-1] * dy[1:] - dx[1:] * dy[:-1]) / 2
+            loss[:-1] += self.curvature * np.sqrt(area)
+            loss[1:] += self.curvature * np.sqrt(area)
+        loss[dx * (self.bounds[1] - self.bounds[0]) < 2 * self.resolution] = 0  # can not be split
+        return loss
+
+    def loss(self) -> float:
+        """maximum loss of the intervals, inf if not enough points"""
+        return self.losses().max() if len(self.data) > 2 else np.inf
+
+    def ask(self, n: int) -> list[float]:
+        """**n** points to be sampled next
+
+        Intervals are split into equal parts, one more part at a time for the interval
+        with the largest loss per part.
+        """
+        if len(self.data) < 2:
+            xs = np.linspace(*self.bounds, max(n, 2))
+            return [x for x in xs.tolist() if x not in self.data][:max(n, 2)]
+
+        x = np.array(sorted(self.data), float)
+        heap = [(-l, i, 1) for i, l in enumerate(self.losses())]
+        heapq.heapify(heap)
+        length = np.diff(x)
+        while n > 0:
+            loss, i, parts = heapq.heappop(heap)
+            if not loss:  # all intervals are at the resolution
+                heapq.heappush(heap, (loss, i, parts))
+                break
+            if length[i] / (parts + 1) < self.resolution:  # not to be split any more
+                heapq.heappush(heap, (0, i, parts))
+                continue
+            heapq.heappush(heap, (loss * parts / (parts + 1), i, parts + 1))
+            n -= 1
+
+        xs = []
+        for _, i, parts in heap:
+            xs.extend(np.linspace(x[i], x[i + 1], parts + 1)[1:-1].tolist())
+        return sorted(xs)
+
+
+class Learner2D(object):
+    """Sample a 2D function where it changes the most
+
+    Sampled points are triangulated and the centroids of the triangles with the largest
+    loss(sqrt of the area times the range of z, normalized) are sampled next.
+    """
+
+    def __init__(self, bounds: tuple[tuple[float, float], tuple[float, float]]):
+        """
+        Args:
+            bounds (tuple[tuple[float, float], tuple[float, float]]): ranges of x and y
+        """
+        self.bounds = np.asarray(bounds, float)
+        self.data: dict[tuple[float, float], float] = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def tell(self, xy: tuple[float, float], z: float):
+        self.data[tuple(xy)] = z
+
+    def tell_many(self, xys: list[tuple[float, float]], zs: list[float]):
+        for xy, z in zip(xys, zs):
+            self.tell(xy, z)
+
+    def triangles(self):
+        from scipy.spatial import Delaunay
+
+        xy = np.array(list(self.data), float)
+        z = np.array(list(self.data.values()), float)
+        xy = (xy - self.bounds[:, 0]) / (self.bounds[:, 1] - self.bounds[:, 0])
+        z = (z - z.min()) / (np.ptp(z) if np.ptp(z) > 0 else 1)
+
+        simplices = Delaunay(xy).simplices
+        a, b, c = (xy[simplices[:, i]] for i in range(3))
+        (ux, uy), (vx, vy) = (b - a).T, (c - a).T
+        area = np.abs(ux * vy - uy * vx) / 2
+        loss = np.sqrt(area) * (np.ptp(z[simplices], axis=1) + 0.1)  # explore flat regions slowly
+        return (a + b + c) / 3, loss
+
+    def loss(self) -> float:
+        return self.triangles()[1].max() if len(self.data) > 3 else np.inf
+
+    def ask(self, n: int) -> list[tuple[float, float]]:
+        """**n** points to be sampled next"""
+        if len(self.data) < 4:
+            m = max(int(np.ceil(np.sqrt(n))), 2)
+            grid = np.stack(np.meshgrid(*(np.linspace(*b, m) for b in self.bounds), indexing='ij'), -1)
+            return [xy for xy in map(tuple, grid.reshape(-1, 2).tolist()) if xy not in self.data]
+
+        centroids, loss = self.triangles()
+        centroids = centroids * (self.bounds[:, 1] - self.bounds[:, 0]) + self.bounds[:, 0]
+        return [tuple(centroids[i]) for i in np.argsort(loss)[::-1][:n]]
+
+
+def spec(task: dict, groups: list[str], npoints: int, rounds: int, goal: float) -> dict:
+    """adaptive loop spec carried by the tasks, for a runtime able to pick the next points itself"""
+    return {'learner': f'{len(groups)}D',
+            'groups': groups,
+            'shape': [len(expand({g: task['body']['loop'][g]})[g][0][1]) for g in groups],
+            'npoints': npoints,
+            'rounds': rounds,
+            'goal': goal}
+
+
+def select(task: dict, groups: list[str], index: np.ndarray) -> dict:
+    """task sampling the given points of the grid only
+
+    The swept groups are zipped into the first one(variables are renamed if duplicated),
+    so every point is a step of a single loop.
+
+    Args:
+        task (dict): task exported by `Recipe`
+        groups (list[str]): swept groups
+        index (np.ndarray): indices of the points in the grid of **groups**, shape (npoints, len(groups))
+
+    Returns:
+        dict: new task
+
+    Raises:
+        ValueError: a path($ variable) is swept by more than one group
+    """
+    task = deepcopy(task)
+    loops: dict = expand(task['body']['loop'])  # exported with compact=True
+    rules: list[str] = task['body']['rule']
+
+    merged, targets = [], set()
+    for dim, group in enumerate(groups):
+        for target, value, unit in loops.pop(group):
+            if target not in targets:
+                new = target
+            elif target.startswith('$'):  # the name is the path written to, can not be renamed
+                raise ValueError(f'{target[1:]} is swept by more than one group of {groups}')
+            else:
+                new = f'{group}_{target}'
+            targets.add(new)
+            merged.append((new, np.asarray(value)[index[:, dim]], unit))
+            rules = [r.replace(f'⟨{group}.{target}⟩', f'⟨{groups[0]}.{new}⟩') for r in rules]
+
+    task['body']['loop'] = {groups[0]: merged} | loops
+    task['body']['rule'] = rules
+    if 'compiled' in task['body']:
+        task['body']['compiled'] = compile_rules(rules, task['body']['loop'])
+    task['body']['step']['main'] = ['WRITE', tuple(task['body']['loop'])]
+    task['meta']['other']['shape'] = [len(v[0][1]) for v in task['body']['loop'].values()]
+    return task
+
+
+def adaptive(task: dict, groups: list[str] = [], npoints: int = 16, rounds: int = 8, goal: float = 0.0,
+             reduce: Callable | None = None, submit: Callable | None = None) -> dict:
+    """Sweep the grid of a task adaptively, round by round
+
+    The grid defined by `Recipe` is the domain, each round samples **npoints** of it chosen
+    by a `Learner1D`(1 group) or `Learner2D`(2 groups) from the results of the previous rounds.
+
+    ***Example***
+    >>> rcp['freq'] = np.linspace(-20, 20, 401) * 1e6
+    >>> r = s.adaptive(rcp.export() | {'base': cfg}, npoints=20, rounds=5)
+    >>> plt.plot(r['coords']['freq']['def'], r['value'])
+
+    Args:
+        task (dict): task exported by `Recipe`
+        groups (list[str], optional): swept groups, 1 or 2. Defaults to the first group(s) of the task.
+        npoints (int, optional): number of points per round. Defaults to 16.
+        rounds (int, optional): maximum number of rounds. Defaults to 8.
+        goal (float, optional): stop if the loss of the learner is below it. Defaults to 0.0.
+        reduce (Callable | None, optional): scalar of a point used by the learner. Defaults to mean of abs.
+        submit (Callable | None, optional): submit a task and return its `Task`. Defaults to `s.submit`.
+
+    Returns:
+        dict: index(in the grid), coords, value(reduced), data(raw) of the sampled points and tids of the rounds
+    """
+    if submit is None:
+        from quark.app import s
+        submit = s.submit
+    reduce = reduce or (lambda y: float(np.mean(np.abs(y))))
+
+    loops = expand(task['body']['loop'])  # descriptors if exported with compact=True
+    task = task | {'body': task['body'] | {'loop': loops}}
+    groups = list(groups or list(loops)[:1])
+    assert 1 <= len(groups) <= 2, 'only 1D or 2D adaptive sweep is supported'
+    shape = [len(loops[g][0][1]) for g in groups]
+    if len(groups) == 1:
+        learner = Learner1D((0, shape[0] - 1), resolution=1)
+    else:
+        learner = Learner2D([(0, n - 1) for n in shape])
+
+    signal = str(task['meta']['other']['signal']).split('.')[-1]
+    done, data, tids = {}, [], []
+    for i in range(rounds):
+        index = []
+        for x in learner.ask(npoints if len(groups) == 1 else 4 * npoints):
+            idx = tuple(int(round(v)) for v in np.atleast_1d(x))
+            if idx not in done and idx not in index and len(index) < npoints:
+                index.append(idx)
+        if not index:
+            logger.info('all points of the grid are sampled')
+            break
+
+        sub = select(task, groups, np.array(index))
+        sub['meta']['other']['adaptive'] = spec(task, groups, npoints, rounds, goal) | {'round': i}
+        t = submit(sub, block=True)
+        t.bar(disable=True)
+        tids.append(t.tid)
+
+        result = t.result()['data']
+        raw = np.asarray(result[signal] if signal in result else next(iter(result.values())))
+        for idx, point in zip(index, raw[:len(index)]):
+            done[idx] = reduce(point)
+            data.append(point)
+            learner.tell(idx[0] if len(idx) == 1 else idx, done[idx])
+
+        if len(learner) > 3 and learner.loss() < goal:
+            break
+
+    index = np.array(list(done), int).reshape(-1, len(groups))
+    return {'index': index,
+            'coords': {g: {t: np.asarray(v)[index[:, dim]] for t, v, u in loops[g]}
+                       for dim, g in enumerate(groups)},
+            'value': np.array(list(done.values())),
+            'data': np.asarray(data),
+            'tids': tids}
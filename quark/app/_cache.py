@@ -0,0 +1,210 @@
+# MIT License
+
+# Copyright (c) 2021 YL Feng <fengyulong@pku.org.cn>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+from loguru import logger
+
+FINAL = ('Finished', 'Archived', 'Failed', 'Canceled')
+
+
+def nbytes(result: dict) -> int:
+    """Total bytes of the arrays in a result"""
+    return sum(v.nbytes for v in result.get('data', {}).values() if isinstance(v, np.ndarray))
+
+
+class ResultCache(object):
+    """Two-tier cache of results keyed by **tid**
+
+    - memory: LRU bounded by the total bytes of the arrays
+    - disk: one directory per tid with a `.npy` file per dataset(memory-mapped, copy-on-write)
+
+    Only records in a final status are cached, they never change afterwards, so entries are
+    returned without asking the server(or database) again.
+    """
+
+    def __init__(self, maxbytes: int = 2 * 1024**3, maxdisk: int = 20 * 1024**3, path: str | Path = ''):
+        """
+        Args:
+            maxbytes (int, optional): memory limit in bytes. Defaults to 2GB.
+            maxdisk (int, optional): disk limit in bytes, 0 to disable the disk tier. Defaults to 20GB.
+            path (str | Path, optional): cache directory. Defaults to `HOME/cache/result`.
+        """
+        self.maxbytes = maxbytes
+        self.maxdisk = maxdisk
+        self.__path = Path(path) if path else None
+
+        self.__memory: OrderedDict[int, tuple] = OrderedDict()
+        self.__nbytes = 0
+        self.__lock = Lock()
+        self.__usage = None  # bytes on disk, scanned once and then tracked
+
+    @property
+    def path(self) -> Path:
+        if self.__path is None:
+            from quark.proxy import HOME
+            self.__path = HOME / 'cache/result'
+        return self.__path
+
+    def __contains__(self, tid: int):
+        return tid in self.__memory or (self.path / str(tid)).exists()
+
+    def get(self, tid: int):
+        """Get the result of **tid**
+
+        Args:
+            tid (int): task id
+
+        Returns:
+            dict | None: cached result
+        """
+        with self.__lock:
+            if tid in self.__memory:
+                self.__memory.move_to_end(tid)
+                return self.__memory[tid][0]
+
+        result = self.load(tid)
+        if result is not None:
+            self.remember(tid, result)
+        return result
+
+    def put(self, tid: int, result: dict, status: str | None):
+        """Cache the result of **tid** if the task is done
+
+        Args:
+            tid (int): task id
+            result (dict): data, meta and task
+            status (str | None): status of the task
+        """
+        if status not in FINAL or not isinstance(result, dict):
+            return
+        self.remember(tid, result)
+        self.dump(tid, result)
+
+    def remember(self, tid: int, result: dict):
+        size = nbytes(result)
+        if size > self.maxbytes:
+            return
+
+        with self.__lock:
+            self.pop(tid)
+            self.__memory[tid] = (result, size)
+            self.__nbytes += size
+            while self.__nbytes > self.maxbytes:
+                self.pop(next(iter(self.__memory)))
+
+    def pop(self, tid: int):
+        try:
+            self.__nbytes -= self.__memory.pop(tid)[-1]
+        except KeyError as e:
+            pass
+
+    def clear(self, disk: bool = True):
+        """Clear the memory(and the disk if **disk** is True)"""
+        with self.__lock:
+            self.__memory.clear()
+            self.__nbytes = 0
+        if disk and self.path.exists():
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.__usage = 0
+
+    # region disk
+    def load(self, tid: int):
+        folder = self.path / str(tid)
+        if not self.maxdisk or not folder.exists():
+            return
+
+        try:
+            with open(folder / 'info.pkl', 'rb') as f:
+                info = pickle.load(f)
+            data = {k: np.load(folder / f'{i}.npy', mmap_mode='c')
+                    for i, k in enumerate(info['keys'])}
+            os.utime(folder)  # for eviction
+            return {'data': data, 'meta': info['meta'], 'task': info['task']}
+        except Exception as e:
+            logger.warning(f'Failed to load {tid} from cache: {e}')
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def dump(self, tid: int, result: dict):
+        folder = self.path / str(tid)
+        if not self.maxdisk or folder.exists():
+            return
+
+        data = result.get('data', {})
+        if not all(isinstance(v, np.ndarray) and v.dtype != object for v in data.values()):
+            return  # only plain arrays can be memory-mapped
+
+        tmp = folder.with_suffix('.tmp')
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            for i, v in enumerate(data.values()):
+                np.save(tmp / f'{i}.npy', v)
+            with open(tmp / 'info.pkl', 'wb') as f:
+                pickle.dump({'keys': list(data),
+                             'meta': result.get('meta', {}),
+                             'task': result.get('task', {})}, f)
+            size = sum(f.stat().st_size for f in tmp.iterdir())
+            tmp.rename(folder)
+        except Exception as e:
+            logger.warning(f'Failed to cache {tid}: {e}')
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        with self.__lock:
+            self.__usage = (self.usage() - size if self.__usage is None else self.__usage) + size
+            full = self.__usage > self.maxdisk
+        if full:
+            self.evict()
+
+    def usage(self) -> int:
+        """bytes on disk"""
+        if self.__usage is None:
+            self.__usage = sum(size for _, size, _ in self.scan())
+        return self.__usage
+
+    def scan(self):
+        folders = []
+        for folder in self.path.iterdir():
+            if folder.suffix == '.tmp':
+                continue
+            size = sum(f.stat().st_size for f in folder.iterdir())
+            folders.append((folder.stat().st_mtime, size, folder))
+        return folders
+
+    def evict(self):
+        """remove the least recently used entries until the disk limit is met"""
+        folders = self.scan()
+        total = sum(size for _, size, _ in folders)
+        for _, size, folder in sorted(folders):
+            if total <= self.maxdisk:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+        with self.__lock:
+            self.__usage = total
+    # endregion disk
@@ -21,6 +21,7 @@
 
 
 import sqlite3
+from contextlib import contextmanager
 from pathlib import Path
 
 import h5py
@@ -42,43 +43,293 @@ def db():
         return sql.setdefault(path, sqlite3.connect(path, check_same_thread=False))
 
 
-def reshape(raw: np.ndarray | list, shape: tuple | list):
+def representable(value: float, dtype: np.dtype) -> bool:
+    """True if **value** is unchanged when cast to **dtype**"""
+    with np.errstate(invalid='ignore', over='ignore'):
+        cast = np.asarray(value).astype(dtype)
+    return bool(cast == value) or bool(np.isnan(value) and np.isnan(cast))
+
+
+def reshape(raw: np.ndarray | list, shape: tuple | list, fill: float = 0, mask: bool = False):
     '''Reshape raw data to original shape and fill zero if shape is larger than raw.
 
     Args:
         raw (np.ndarray | list): raw data
         shape (tuple | list): sweep shape
+        fill (float, optional): value of the missing points, e.g. np.nan. Defaults to 0.
+        mask (bool, optional): also return a boolean mask of the valid points if True. Defaults to False.
 
     Returns:
-        np.ndarray | list: reshaped data
+        np.ndarray | list: reshaped data(a view of raw if the sweep is complete), and the mask if required
 
     '''
     try:
         raw = np.asarray(raw)
-        idx = np.unravel_index(np.arange(raw.shape[0]), shape)
-        data = np.full((*shape, *raw.shape[1:]), 0, raw.dtype)
-        data[idx] = raw
+        size = int(np.prod(shape))
+        if raw.shape[0] == size:  # complete, no copy
+            data = raw.reshape(*shape, *raw.shape[1:])
+        else:
+            # keep the dtype unless the fill value(e.g. nan for integers) is not representable
+            dtype = raw.dtype if representable(fill, raw.dtype) else np.result_type(raw.dtype, np.min_scalar_type(fill))
+            data = np.full((*shape, *raw.shape[1:]), fill, dtype)
+            # points are stored in C order, so the first len(raw) points are filled
+            data.reshape(size, *raw.shape[1:])[:raw.shape[0]] = raw
     except Exception as e:
         logger.error(f'{e}')
-        data = raw
+        return (raw, np.ones(np.shape(raw)[:1], bool)) if mask else raw
 
+    if mask:
+        valid = np.zeros(size, bool)
+        valid[:raw.shape[0]] = True
+        return data, valid.reshape(shape)
     return data
 
 
-def get_dataset_by_tid(tid: int, task: bool = False):
-    from quark.proxy import HOME
+class Dataset(object):
+    """Array-like proxy of a dataset in an hdf5 or zarr file.
 
-    filename, dataset = get_record_by_tid(tid)[7:9]
-    filename = str(HOME / f'dat/{Path(filename).name}')
-    # print(f'Loading dataset from {filename}')
+    Nothing is read until the proxy is indexed (or converted with `np.asarray`),
+    and only the points selected along the sweep axes are read from the file.
+
+    ***Example***
+    >>> info, data = get_dataset_by_tid(tid, lazy=True)
+    >>> data['iq_avg'][3, :]  # one line of a 2D sweep
+    >>> data['iq_avg'].sel(freq=6.5e9)  # by sweep coordinate
+    """
+
+    def __init__(self, filename: str, dataset: str, key: str, shape: tuple | list | int = -1, axis: dict = {}, ds=None):
+        """
+        Args:
+            filename (str): hdf5 or zarr file.
+            dataset (str): group of the record in the file.
+            key (str): name of the signal(e.g. iq_avg).
+            shape (tuple | list | int, optional): sweep shape, -1 if unknown. Defaults to -1.
+            axis (dict, optional): sweep coordinates, i.e. meta['axis']. Defaults to {}.
+            ds (optional): the opened dataset to get dtype and shape from. Defaults to None.
+        """
+        self.filename = filename
+        self.dataset = dataset
+        self.key = key
+        self.axis = axis
+
+        if ds is None:
+            with _open(filename) as f:
+                self.inspect(f[f'{dataset}/{key}'])
+        else:
+            self.inspect(ds)
 
+        self.sweep = (self.rows,) if shape == -1 else tuple(shape)
+
+    def inspect(self, ds):
+        self.dtype = ds.dtype
+        if self.filename.endswith('zarr'):
+            self.rshape = tuple(ds.chunks)  # shape of one point
+            self.rows = int(np.prod(ds.shape)) // int(np.prod(ds.chunks))
+        else:
+            self.rshape = tuple(ds.shape[1:])
+            self.rows = ds.shape[0]
+
+    def __repr__(self):
+        return f'Dataset({self.key}, shape={self.shape}, dtype={self.dtype})'
+
+    @property
+    def shape(self):
+        return (*self.sweep, *self.rshape)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if sum(not isinstance(k, slice) and k is not Ellipsis and np.ndim(k) > 0 for k in key) > 1:
+            # numpy pairs multiple index arrays pointwise, see `take` for the grid they span
+            raise IndexError('only one array index is supported, use `take` for orthogonal indexing')
+        return self.take(key)
+
+    def take(self, key: tuple):
+        """Orthogonal indexing, each array index selects along its own axis(like `np.ix_`)
+
+        ***Example***
+        >>> data['iq_avg'].take(([0, 2], [1, 3]))  # shape (2, 2, ...)
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [k is Ellipsis for k in key].index(True)
+            fill = (slice(None),) * (self.ndim - len(key) + 1)
+            key = key[:i] + fill + key[i + 1:]
+
+        skey = key[:len(self.sweep)]
+        skey += (slice(None),) * (len(self.sweep) - len(skey))
+        rkey = key[len(self.sweep):]
+
+        index, drop = [], []
+        for axis, (k, n) in enumerate(zip(skey, self.sweep)):
+            if isinstance(k, slice):
+                index.append(np.arange(*k.indices(n)))
+                continue
+
+            k = np.asarray(k)
+            if k.dtype == bool:
+                if k.shape != (n,):
+                    raise IndexError(f'boolean index of shape {k.shape} does not match axis {axis} of size {n}')
+                k = np.flatnonzero(k)
+            elif ((k < -n) | (k >= n)).any():
+                raise IndexError(f'index {k} is out of bounds for axis {axis} with size {n}')
+            if k.ndim == 0:
+                drop.append(len(index))
+            index.append(np.atleast_1d(k % n))
+
+        flat = np.ravel_multi_index(np.ix_(*index), self.sweep)
+        valid = flat < self.rows  # sweep may be incomplete
+        rows = np.unique(flat[valid])
+
+        data = np.zeros((*flat.shape, *self.rshape), self.dtype)
+        if rows.size:
+            data[valid] = self.read(rows)[np.searchsorted(rows, flat[valid])]
+        data = data[tuple(0 if i in drop else slice(None)
+                          for i in range(len(index)))]
+        return data[(slice(None),) * (len(index) - len(drop)) + rkey]
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        """Read raw points(sorted and unique) from the file.
+
+        Args:
+            rows (np.ndarray): indices of the points
+
+        Returns:
+            np.ndarray: array of shape (len(rows), *rshape)
+        """
+        lo, hi = int(rows[0]), int(rows[-1]) + 1
+        contiguous = hi - lo == len(rows)
+
+        with _open(self.filename) as f:
+            ds = f[f'{self.dataset}/{self.key}']
+            if self.filename.endswith('hdf5'):
+                return ds[lo:hi] if contiguous else ds[rows]
+
+            m = int(np.prod(self.rshape))
+            if contiguous and len(ds.shape) == 1:
+                data = ds[lo * m:hi * m]
+            else:
+                flat = (rows[:, None] * m + np.arange(m)).ravel()
+                data = ds.vindex[np.unravel_index(flat, ds.shape)]
+            return data.reshape(len(rows), *self.rshape)
+
+    def sel(self, **coords):
+        """Index the dataset by sweep coordinates(nearest point).
+
+        Args:
+            coords: name of the loop(or variable in the loop) and its value(s) or slice(start, stop).
+
+        Returns:
+            np.ndarray: selected data
+        """
+        key = [slice(None)] * len(self.sweep)
+        for name, value in coords.items():
+            for dim, (group, variables) in enumerate(self.axis.items()):
+                if name == group:
+                    grid = np.asarray(tuple(variables.values())[0])
+                elif name in variables:
+                    grid = np.asarray(variables[name])
+                else:
+                    continue
+                break
+            else:
+                raise KeyError(f'{name} not found in {tuple(self.axis)}')
+
+            if isinstance(value, slice):
+                lo = -np.inf if value.start is None else value.start
+                hi = np.inf if value.stop is None else value.stop
+                key[dim] = (grid >= lo) & (grid <= hi)
+            else:
+                key[dim] = np.abs(grid[:, None] - np.ravel(value)).argmin(0)
+                if np.ndim(value) == 0:
+                    key[dim] = int(key[dim][0])
+        return self.take(tuple(key))
+
+
+@contextmanager
+def _open(filename: str):
+    """Open an hdf5 file or a zarr group for reading"""
     if filename.endswith('hdf5'):
         f = h5py.File(filename, 'r')
     elif filename.endswith('zarr'):
         f = zarr.open_group(filename, mode='r')
     else:
+        raise ValueError(f'Unsupported file format: {filename}')
+
+    try:
+        yield f
+    finally:
+        if isinstance(f, h5py.File):
+            f.close()
+
+
+def get_dataset_by_tid(tid: int, task: bool = False, lazy: bool = False):
+    """Get dataset of a record
+
+    Args:
+        tid (int): task id
+        task (bool, optional): return task info only if True. Defaults to False.
+        lazy (bool, optional): return array-like `Dataset` proxies instead of arrays if True. Defaults to False.
+
+    Returns:
+        tuple: info & data
+    """
+    from quark.proxy import HOME
+
+    filename, dataset = get_record_by_tid(tid)[7:9]
+    filename = str(HOME / f'dat/{Path(filename).name}')
+    # print(f'Loading dataset from {filename}')
+
+    if not filename.endswith(('hdf5', 'zarr')):
         logger.error(f'Unsupported file format: {filename}')
         return {}, {}
+
+    with _open(filename) as f:
+        return read_dataset(f, filename, dataset, task, lazy)
+
+
+def get_datasets_by_file(filename: str, datasets: list[str], lazy: bool = False):
+    """Read many datasets from a file which is opened only once
+
+    Args:
+        filename (str): hdf5 or zarr file
+        datasets (list[str]): groups of the records in the file
+        lazy (bool, optional): see `get_dataset_by_tid`. Defaults to False.
+
+    Yields:
+        tuple: dataset, info & data(both None if the dataset can not be read)
+    """
+    with _open(filename) as f:
+        for dataset in datasets:
+            try:
+                info, data = read_dataset(f, filename, dataset, lazy=lazy)
+            except Exception as e:  # the others are still read
+                logger.error(f'Failed to read {dataset} from {filename}: {e}')
+                info, data = None, None
+            yield dataset, info, data
+
+
+def read_dataset(f, filename: str, dataset: str, task: bool = False, lazy: bool = False):
     group = f[dataset]
 
     info, data = {}, {}
@@ -99,6 +350,11 @@ def get_dataset_by_tid(tid: int, task: bool = False):
 
     for k in group.keys():
         ds = group[f'{k}']
+        if lazy:
+            axis = info['meta'].get('axis', {})
+            data[k] = Dataset(filename, dataset, k, shape, axis, ds)
+            continue
+
         data[k] = ds[:]
         if shape == -1:
             continue
@@ -107,9 +363,6 @@ def get_dataset_by_tid(tid: int, task: bool = False):
             data[k] = data[k].reshape(-1, *ds.chunks)
         data[k] = reshape(data[k], shape)
 
-    if isinstance(f, h5py.File):
-        f.close()
-
     return info, data
 
 
@@ -151,6 +404,26 @@ def get_tree_of_file(filename: str):
         return d
 
 
+repos = {}
+
+
+def get_repo(path: str | Path):
+    """Get the git repository of cfg(opened only once)
+
+    Args:
+        path (str | Path): directory of the repository
+
+    Returns:
+        git.Repo: repository
+    """
+    import git
+
+    try:
+        return repos[str(path)]
+    except KeyError:
+        return repos.setdefault(str(path), git.Repo(path))
+
+
 def get_commit_by_tid(tid: int = 0):
 
     # git config --global --add safe.directory path/to/cfg
@@ -169,7 +442,7 @@ def get_commit_by_tid(tid: int = 0):
         file: Path = (HOME / f'cfg/{ckpt}').with_suffix('.json')
         print(file)
 
-        repo = git.Repo(file.resolve().parent)
+        repo = get_repo(file.resolve().parent)
         if not tid:
             commit = repo.head.commit
         else:
@@ -203,6 +476,28 @@ def get_record_by_rid(rid: int, table: str = 'task'):
         logger.error(f'Record {rid} not found: {e}!')
 
 
+def get_record_list_by_tids(tids: list[int], table: str = 'task'):
+    return _select_in('tid', tids, table)
+
+
+def get_record_list_by_rids(rids: list[int], table: str = 'task'):
+    return _select_in('id', rids, table)
+
+
+def _select_in(column: str, values: list, table: str = 'task'):
+    try:
+        records = []
+        for i in range(0, len(values), 500):  # limited number of host parameters
+            chunk = [str(v) for v in values[i:i + 500]]
+            marks = ','.join('?' * len(chunk))
+            records.extend(db().execute(
+                f'select * from {table} where {column} in ({marks})', chunk).fetchall())
+        return records
+    except Exception as e:
+        logger.error(f'Records not found: {e}!')
+        return []
+
+
 def get_record_list_by_name(task: str, start: str, end: str, table: str = 'task'):
     try:
         return db().execute(f'select * from {table} where name like "%{task}%" and created between "{start}" and "{end}" limit -1').fetchall()
@@ -210,6 +505,81 @@ def get_record_list_by_name(task: str, start: str, end: str, table: str = 'task'
         logger.error(f'Records not found: {e}!')
 
 
+COLUMNS = ('id', 'tid', 'name', 'user', 'priority', 'system', 'status',
+           'filename', 'dataset', 'created', 'finished', 'committed')
+
+
+def _where(name: str = '', status: str = '', user: str = '', start: str = '', end: str = '', tids: tuple = ()):
+    clauses, params = [], []
+    for column, op, value in [('name', 'like', f'%{name}%' if name else ''),
+                              ('status', '=', status),
+                              ('user', '=', user),
+                              ('created', '>=', start),
+                              ('created', '<=', end),
+                              ('tid', '>=', tids[0] if tids else 0),
+                              ('tid', '<=', tids[-1] if tids else 0)]:
+        if value:
+            clauses.append(f'{column} {op} ?')
+            params.append(value)
+    return clauses, params
+
+
+def get_record_page(columns: tuple[str] = COLUMNS, size: int = 100, after: int | None = None, offset: int = 0,
+                    desc: bool = True, table: str = 'task', **filters):
+    """Get one page of records, paginated by the cursor(i.e. id of the last record) or offset
+
+    Args:
+        columns (tuple[str], optional): columns to select. Defaults to COLUMNS.
+        size (int, optional): page size. Defaults to 100.
+        after (int | None, optional): cursor returned by the previous page. Defaults to None.
+        offset (int, optional): number of records to skip, used if no cursor given. Defaults to 0.
+        desc (bool, optional): newest first if True. Defaults to True.
+
+    Keyword Arguments: filters
+        name (str): task name(fuzzy)
+        status (str): status of the task
+        user (str): name of the user
+        start (str): created after
+        end (str): created before
+        tids (tuple): range of task id, (first, last)
+
+    Returns:
+        tuple: records, cursor of the next page(None if no more records)
+    """
+    columns = [c for c in columns if c in COLUMNS]
+    clauses, params = _where(**filters)
+    if after is not None:
+        clauses.append(f'id {"<" if desc else ">"} ?')
+        params.append(after)
+
+    sql = f'select {", ".join(columns)}, id from {table}'
+    if clauses:
+        sql += f' where {" and ".join(clauses)}'
+    sql += f' order by id {"desc" if desc else "asc"} limit ? offset ?'
+    params.extend([size, 0 if after is not None else offset])
+
+    try:
+        records = db().execute(sql, params).fetchall()
+    except Exception as e:
+        logger.error(f'Records not found: {e}!')
+        return [], None
+
+    cursor = records[-1][-1] if len(records) == size else None
+    return [r[:-1] for r in records], cursor
+
+
+def count_records(table: str = 'task', **filters) -> int:
+    clauses, params = _where(**filters)
+    sql = f'select count(*) from {table}'
+    if clauses:
+        sql += f' where {" and ".join(clauses)}'
+    try:
+        return db().execute(sql, params).fetchone()[0]
+    except Exception as e:
+        logger.error(f'Records not found: {e}!')
+        return 0
+
+
 def get_record_set_by_name():
     try:
         return db().execute('select distinct task.name from task').fetchall()
@@ -20,11 +20,54 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
-from functools import cached_property
+import atexit
+import hashlib
+import inspect
+import json
+import os
+import time
+from functools import cached_property, partial
+from typing import Callable
 
 import numpy as np
-import sympy as sp
-from lmfit import Model, Parameters
+from loguru import logger
+
+
+def source(func: Callable) -> dict | None:
+    """source of a lambdified function, None if it uses anything other than numpy"""
+    try:
+        names = [k for k in func.__code__.co_names if k in func.__globals__]
+        if all(getattr(np, k, None) is func.__globals__[k] for k in names):
+            return {'code': inspect.getsource(func), 'name': func.__name__, 'globals': names}
+    except Exception as e:
+        return
+
+
+def build(source: dict) -> Callable:
+    namespace = {k: getattr(np, k) for k in source['globals']}
+    exec(source['code'], namespace)
+    return namespace[source['name']]
+
+
+def load(key: str) -> dict:
+    """compiled formula in the cache, empty if not found"""
+    try:
+        from quark.proxy import HOME
+        return json.loads((HOME / f'cache/lambdify/{key}.json').read_text())
+    except Exception as e:
+        return {}
+
+
+def dump(key: str, cached: dict):
+    try:
+        from quark.proxy import HOME
+        file = HOME / f'cache/lambdify/{key}.json'
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f'.{os.getpid()}')
+        tmp.write_text(json.dumps(cached))
+        tmp.replace(file)  # atomic, shared by processes
+    except Exception as e:
+        logger.warning(f'Failed to cache {key}: {e}')
 
 
 class SymbolicFunction(object):
@@ -36,16 +79,24 @@ class SymbolicFunction(object):
     >>> T1(t = np.array([1, 2, 3]), **params)
     """
 
-    def __init__(self, name: str, expr: str, independent_vars: list[str]):
+    def __init__(self, name: str, expr: str, independent_vars: list[str], guess: Callable | None = None):
+        """
+        Args:
+            name (str): name of the function
+            expr (str): formula
+            independent_vars (list[str]): independent variables, the others are parameters
+            guess (Callable | None, optional): initial values of the parameters estimated from (x, y),
+                used for parameters not given to **fit**. Defaults to None.
+        """
         self.name = name
-        self.__expr = sp.parse_expr(expr, evaluate=True)
+        self.formula = expr
         self.__vars = independent_vars
+        self.guess = guess
 
         self.lambdify()
-        self.__model = Model(self.__func, independent_vars=self.__vars)
 
     def __repr__(self):
-        return f'{self.name}{tuple(self.args)}'
+        return f'{self.name}{tuple(self.names)}'
 
     def show(self):
         print(self)
@@ -55,16 +106,30 @@ class SymbolicFunction(object):
         except Exception as e:
             print(e)
 
-    @property
+    @cached_property
     def expr(self):
-        return self.__expr
+        import sympy as sp
+        return sp.parse_expr(self.formula, evaluate=True)
 
     @property
     def func(self):
         return self.__func
 
+    @property
+    def vars(self) -> list[str]:
+        """independent variables"""
+        return list(self.__vars)
+
+    @cached_property
+    def model(self):
+        from lmfit import Model
+        return Model(self.__func, independent_vars=self.__vars)
+
     @cached_property
-    def args(self) -> list[sp.Symbol]:
+    def args(self) -> list:
+        """symbols of the arguments(sympy.Symbol), in the order of **func**"""
+        import sympy as sp
+
         args = []
         for s in self.expr.atoms(sp.Symbol):
             if s.name in self.__vars:
@@ -74,26 +139,70 @@ class SymbolicFunction(object):
         # return sorted(args, key=lambda arg: arg.name, reverse=True)
         return sorted(args, key=lambda arg: str(self.expr).index(arg.name))
 
+    @cached_property
+    def jacobian(self) -> dict[str, Callable] | None:
+        """partial derivatives with respect to the parameters, None if not derivable(e.g. abs of a complex)"""
+        cached = load(self.key)
+        if 'jacobian' not in cached:
+            import sympy as sp
+
+            jacobian = {}
+            for arg in self.args:
+                if arg.name in self.__vars:
+                    continue
+                d = sp.diff(self.expr, arg)
+                if d.has(sp.Derivative, sp.Subs):
+                    jacobian = None
+                    break
+                jacobian[arg.name] = sp.lambdify(self.args, d)
+            cached['jacobian'] = jacobian and {k: source(f) for k, f in jacobian.items()}
+            if cached['jacobian'] is None or all(cached['jacobian'].values()):
+                dump(self.key, cached)
+            return jacobian
+        return cached['jacobian'] and {k: build(v) for k, v in cached['jacobian'].items()}
+
+    @cached_property
+    def key(self) -> str:
+        from importlib.metadata import version
+        return hashlib.sha1(f'{self.formula}|{self.__vars}|{version("sympy")}|{np.__version__}'.encode()).hexdigest()
+
+    def estimate(self, x: np.ndarray, y: np.ndarray) -> dict:
+        """initial values of the parameters estimated by **guess**, empty if failed"""
+        try:
+            return self.guess(np.asarray(x), np.asarray(y)) if self.guess else {}
+        except Exception as e:
+            return {}
+
     def fit(self, data: np.ndarray, **kwds):
         assert len(data.shape) == 1, 'the input data must be a 1D array!'
 
-        params = {}
-        for arg in self.args:
-            if arg.name in self.__model.independent_vars:
+        params, guess = {}, None
+        for arg in self.names:
+            if arg in self.__vars:
                 continue
-            assert arg.name in kwds, f'parameter {arg.name} is missing!'
-            params[arg.name] = kwds.pop(arg.name)
+            if arg not in kwds and guess is None:
+                guess = self.estimate(kwds.get(self.__vars[0]), data)
+            assert arg in kwds or arg in guess, f'parameter {arg} is missing!'
+            params[arg] = kwds.pop(arg) if arg in kwds else guess[arg]
+
+        kwds['params'] = self.model.make_params(**params)
 
-        kwds['params'] = self.__model.make_params(**params)
+        if self.jacobian and not np.iscomplexobj(data) and kwds.get('method', 'leastsq') == 'leastsq':
+            def dfun(params, data: np.ndarray, weights: np.ndarray | None, **kws):
+                values = params.valuesdict() | kws
+                jac = [-np.broadcast_to(self.jacobian[k](**values), data.shape) * (1 if weights is None else weights)
+                       for k in params if params[k].vary]
+                return np.asarray(jac)
+            kwds['fit_kws'] = {'Dfun': dfun, 'col_deriv': True} | kwds.get('fit_kws', {})
 
         # from matplotlib.axes import Axes
         ax = kwds.pop('ax', None)
         # title = kwds.pop('title', '')
 
-        result = self.__model.fit(data, **kwds)
+        result = self.model.fit(data, **kwds)
 
         if ax:
-            _var = self.__model.independent_vars[0]
+            _var = self.model.independent_vars[0]
             ax.plot(kwds[_var], data, 'bo')
             ax.plot(kwds[_var], result.best_fit, 'r.-')
             ax.legend(['raw', 'fit'])
@@ -101,51 +210,339 @@ class SymbolicFunction(object):
 
         return result
 
+    def fit_many(self, data: np.ndarray, axis: int = -1, max_nfev: int = 200, ftol: float = 1e-10, **kwds) -> dict:
+        """Fit many traces at once with a vectorized Levenberg-Marquardt
+
+        ***Example***
+        >>> r = T1.fit_many(data, t=t, A=1, B=0, T1=np.full(72, 20e-6))  # data.shape == (72, len(t))
+        >>> r['params']['T1'][r['success']]
+
+        Args:
+            data (np.ndarray): traces along **axis**, any other dimensions are batched
+            axis (int, optional): axis of the independent variable. Defaults to -1.
+            max_nfev (int, optional): maximum number of iterations. Defaults to 200.
+            ftol (float, optional): relative change of the cost to stop. Defaults to 1e-10.
+
+        Keyword Arguments: Kwds
+            independent variable (np.ndarray): shared by all traces or broadcastable to the batch
+            parameters (float | np.ndarray | dict): initial values, shared or one per trace, or
+                `dict(value=..., min=..., max=..., vary=...)` as in **fit**
+
+        Returns:
+            dict: params, errors(standard errors), success(mask), chisqr and best_fit, batched as **data**
+        """
+        data = np.moveaxis(np.asarray(data), axis, -1)
+        batch, n = data.shape[:-1], data.shape[-1]
+        y = data.reshape(-1, n)
+
+        names, inputs, p0, lower, upper, vary, guesses = [], [], [], [], [], [], None
+        for arg in self.names:
+            if arg in self.__vars:
+                x = np.asarray(kwds[arg])
+                x = np.broadcast_to(x, (*batch, n)).reshape(-1, n) if x.ndim > 1 else x[None]
+                inputs.append(x)
+                continue
+            if arg not in kwds and guesses is None:
+                x = np.broadcast_to(np.asarray(kwds[self.__vars[0]]), (*batch, n)).reshape(-1, n)
+                guesses = [self.estimate(xi, yi) for xi, yi in zip(x, y)]
+            if arg not in kwds:
+                assert all(arg in g for g in guesses), f'parameter {arg} is missing!'
+                kwds[arg] = np.reshape([g[arg] for g in guesses], batch)
+            spec = kwds[arg] if isinstance(kwds[arg], dict) else {'value': kwds[arg]}
+            names.append(arg)
+            p0.append(np.broadcast_to(np.asarray(spec['value'], float), batch).reshape(-1))
+            lower.append(spec.get('min', -np.inf))
+            upper.append(spec.get('max', np.inf))
+            vary.append(spec.get('vary', True))
+        p = np.stack(p0, -1).astype(float)  # (batch, params)
+        lower, upper, vary = np.array(lower, float), np.array(upper, float), np.array(vary)
+
+        def model(p: np.ndarray, idx: np.ndarray):
+            args = [x if len(x) == 1 else x[idx] for x in inputs]
+            args = [args.pop(0) if arg in self.__vars else p[:, names.index(arg), None]
+                    for arg in self.names]  # in the order of self.names
+            return np.broadcast_to(self.func(*args), (len(idx), n))
+
+        def residual(p: np.ndarray, idx: np.ndarray):
+            r = model(p, idx) - y[idx]
+            return np.concatenate([r.real, r.imag], -1) if np.iscomplexobj(r) else r
+
+        def jacobian(p: np.ndarray, r: np.ndarray, idx: np.ndarray):
+            J = np.zeros((*r.shape, p.shape[1]))
+            if self.jacobian:
+                args = [x if len(x) == 1 else x[idx] for x in inputs]
+                values = {arg: args.pop(0) if arg in self.__vars else p[:, names.index(arg), None]
+                          for arg in self.names}
+                for i in np.flatnonzero(vary):
+                    d = np.broadcast_to(self.jacobian[names[i]](**values), (len(idx), n))
+                    J[..., i] = np.concatenate([d.real, d.imag], -1) if J.shape[1] > n else d.real
+                return J
+            for i in np.flatnonzero(vary):
+                h = np.sqrt(np.finfo(float).eps) * np.where(p[:, i] != 0, np.abs(p[:, i]), 1)
+                dp = p.copy()
+                dp[:, i] += h
+                J[..., i] = (residual(dp, idx) - r) / h[:, None]
+            return J
+
+        with np.errstate(all='ignore'):
+            r = residual(p, np.arange(len(p)))
+            cost = np.sum(r**2, -1)
+            lam = np.full(len(p), 1e-3)
+            active = np.isfinite(cost)
+            converged = np.zeros(len(p), bool)
+            for _ in range(max_nfev):
+                if not active.any():
+                    break
+                idx = np.flatnonzero(active)
+                J = jacobian(p[idx], r[idx], idx)
+                A = J.transpose(0, 2, 1) @ J
+                g = np.einsum('bnp,bn->bp', J, r[idx])
+                diag = np.diagonal(A, axis1=1, axis2=2)
+                A = A + (lam[idx, None] * diag + 1e-30)[..., None] * np.eye(len(names))
+                try:
+                    step = np.linalg.solve(A, -g[..., None])[..., 0]
+                except np.linalg.LinAlgError as e:
+                    step = -(np.linalg.pinv(A) @ g[..., None])[..., 0]
+                trial = np.clip(p[idx] + step * vary, lower, upper)
+                rt = residual(trial, idx)
+                ct = np.sum(rt**2, -1)
+
+                better = np.isfinite(ct) & (ct <= cost[idx])
+                done = better & (cost[idx] - ct <= ftol * cost[idx])
+                b = idx[better]
+                p[b], r[b], cost[b] = trial[better], rt[better], ct[better]
+                lam[b] /= 10
+                lam[idx[~better]] *= 10
+                converged[idx[done]] = True
+                active[idx[done | (lam[idx] > 1e16)]] = False
+
+            J = jacobian(p, r, np.arange(len(p)))
+            dof = max(r.shape[-1] - vary.sum(), 1)
+            cov = np.linalg.pinv(J.transpose(0, 2, 1) @ J) * (cost / dof)[:, None, None]
+            errors = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+
+        success = converged & np.all(np.isfinite(p), -1) & np.all(np.isfinite(errors[:, vary]), -1)
+        best_fit = model(p, np.arange(len(p)))
+        return {'params': {k: p[:, i].reshape(batch) for i, k in enumerate(names)},
+                'errors': {k: errors[:, i].reshape(batch) for i, k in enumerate(names)},
+                'success': success.reshape(batch),
+                'chisqr': cost.reshape(batch),
+                'best_fit': np.moveaxis(best_fit.reshape(*batch, n), -1, axis)}
+
     def __call__(self, *args, **kwds):
         if not self.func:
             self.lambdify()
         return self.func(*args, **kwds)
 
     def lambdify(self):
-        self.__func = sp.lambdify(self.args, self.expr)
+        """compile the formula, loaded from the cache(`HOME/cache/lambdify`) if compiled before"""
+        cached = load(self.key)
+        if 'func' in cached:
+            self.names = cached['args']
+            self.__func = build(cached['func'])
+            return
 
+        import sympy as sp
 
-S21 = SymbolicFunction('S21',
-                       'A * abs(1 - (Ql / abs(Qc) * exp(1j*phi)) / (1 + 2j * Ql * (f - fr)/fr)) + B',
-                       ['f'])
+        self.names = [arg.name for arg in self.args]
+        self.__func = sp.lambdify(self.args, self.expr)
+        if code := source(self.__func):
+            dump(self.key, cached | {'args': self.names, 'func': code})
 
-T1 = SymbolicFunction('T1',
-                      'A * exp(-t / T1) + B',
-                      ['t'])
 
-Rabi = SymbolicFunction('Rabi',
-                        'A * exp(-t / Tr) * cos(2 * pi * Omega * t + phi) + B',
-                        ['t'])
+def guess_decay(x: np.ndarray, y: np.ndarray) -> dict:
+    """exponential decay, `A * exp(-t / T1) + B` or `A * p**t + B`, by a log-linear fit"""
+    tail = max(len(y) // 10, 1)
+    B = np.mean(y[np.argsort(x)[-tail:]])
+    A = y[np.argmin(x)] - B
+    mask = np.abs(y - B) > 0.1 * np.abs(A)
+    slope = np.polyfit(x[mask], np.log(np.abs(y[mask] - B)), 1)[0] if mask.sum() > 1 else 0
+    T1 = -1 / slope if slope < 0 else np.ptp(x)
+    return {'A': A, 'B': B, 'T1': T1, 'p': np.exp(-1 / T1)}
 
-Ramsey = SymbolicFunction('Ramsey',
-                          'A * exp(-t / 2 / T1 - (t / Tphi)**2) * cos(2 * pi * Delta * t + phi) + B',
-                          ['t'])
 
+def guess_oscillation(x: np.ndarray, y: np.ndarray, phase: float = 0.0) -> dict:
+    """damped oscillation, `A * cos(2 * pi * f * t + phi) + B`, frequency and phase from the peak of FFT
 
-RamseyWithBeat = SymbolicFunction('RamseyWithBeat',
-                                  """A * exp(-t / 2 / T1 - (t / Tphi)**2) * cos(2 * pi * Delta * t + phi) * cos(2 * pi * Delta2 * t + phi2) + B""",
-                                  ['t'])
+    Args:
+        phase (float, optional): pi/2 for sin. Defaults to 0.0.
+    """
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    t = np.linspace(x[0], x[-1], len(x))  # uniform grid
+    y = np.interp(t, x, y)
+    B = np.mean(y)
+    spectrum = np.fft.rfft(y - B, 4 * len(y))
+    freqs = np.fft.rfftfreq(4 * len(y), t[1] - t[0])
+    k = np.argmax(np.abs(spectrum[1:])) + 1
+    f = freqs[k]
+    phi = np.angle(spectrum[k]) - 2 * np.pi * f * t[0] + phase
+    span = np.ptp(x)
+    return {'A': np.ptp(y) / 2, 'B': B, 'phi': np.angle(np.exp(1j * phi)), 'phi2': 0.0,
+            'f': f, 'Omega': f, 'Delta': f, 'Delta2': 0.0,
+            'Tr': span, 'T1': 2 * span, 'Tphi': span}
+
+
+def guess_peak(x: np.ndarray, y: np.ndarray) -> dict:
+    """a single peak(or dip) without offset, `A * exp(-((t - mu) / sigma)**2 / 2)` or Lorentzian"""
+    baseline = np.median(y)
+    i = np.argmax(np.abs(y - baseline))
+    height = y[i] - baseline
+    fwhm = np.sum(np.abs(y - baseline) > np.abs(height) / 2) * np.ptp(x) / max(len(x) - 1, 1)
+    return {'A': y[i], 'mu': x[i], 'sigma': fwhm / 2.355,
+            'omega0': x[i], 'Gamma': fwhm}
+
+
+def guess_lorentzian(x: np.ndarray, y: np.ndarray) -> dict:
+    guess = guess_peak(x, y)
+    return guess | {'A': guess['A'] * guess['Gamma'] / 2}
+
+
+def guess_s21(x: np.ndarray, y: np.ndarray) -> dict:
+    """dip of the transmission, depth and width give Ql/Qc and Ql"""
+    A = np.median(y)
+    i = np.argmin(y)
+    depth = np.clip(1 - y[i] / A, 0.01, 0.99)
+    fwhm = max(np.sum(y < (A + y[i]) / 2), 1) * np.ptp(x) / max(len(x) - 1, 1)
+    Ql = x[i] / fwhm
+    return {'A': A, 'B': 0.0, 'fr': x[i], 'Ql': Ql, 'Qc': Ql / depth, 'phi': 0.0}
+
+
+# built-in models, created on first access(see `__getattr__`)
+MODELS = {'S21': ('A * abs(1 - (Ql / abs(Qc) * exp(1j*phi)) / (1 + 2j * Ql * (f - fr)/fr)) + B',
+                  ['f'], guess_s21),
+          'T1': ('A * exp(-t / T1) + B',
+                 ['t'], guess_decay),
+          'Rabi': ('A * exp(-t / Tr) * cos(2 * pi * Omega * t + phi) + B',
+                   ['t'], guess_oscillation),
+          'Ramsey': ('A * exp(-t / 2 / T1 - (t / Tphi)**2) * cos(2 * pi * Delta * t + phi) + B',
+                     ['t'], guess_oscillation),
+          'RamseyWithBeat': ('A * exp(-t / 2 / T1 - (t / Tphi)**2) * cos(2 * pi * Delta * t + phi) * cos(2 * pi * Delta2 * t + phi2) + B',
+                             ['t'], guess_oscillation),
+          'RB': ('A * p**t + B',
+                 ['t'], guess_decay),
+          'Sin': ('A * sin(2 * pi * f * t + phi) + B',
+                  ['t'], partial(guess_oscillation, phase=np.pi / 2)),
+          'Gauss': ('A * exp(-((t - mu) / sigma)**2 / 2)',
+                    ['t'], guess_peak),
+          'Lorentzian': ('(A*Gamma/2) / ((Gamma/2)**2 + (omega - omega0)**2)',
+                         ['omega'], guess_lorentzian),
+          }
+
+
+def __getattr__(name: str) -> SymbolicFunction:
+    try:
+        expr, independent_vars, guess = MODELS[name]
+    except KeyError as e:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from e
+    model = globals()[name] = SymbolicFunction(name, expr, independent_vars, guess)
+    return model
+
+
+def __dir__():
+    return sorted([*globals(), *MODELS])
+
+
+_models: dict[tuple, SymbolicFunction] = {}  # models in the worker process
+_executor = None
+_workers = 0  # size of the pool
+
+
+@atexit.register
+def shutdown():
+    """shut down the pool of **fit_parallel** if any"""
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def warmup(models: list[str | tuple]):
+    """initializer of the workers, models are built before any fit"""
+    for model in models:
+        resolve(model)
+
+
+def resolve(model: str | tuple) -> SymbolicFunction:
+    """built-in model by name or (name, expr, independent_vars, guess)"""
+    if isinstance(model, str):
+        return __getattr__(model)
+    key = (model[0], model[1], tuple(model[2]))
+    if key not in _models:
+        _models[key] = SymbolicFunction(*model)
+    return _models[key]
+
+
+def fit_one(model: str | tuple, x: np.ndarray, y: np.ndarray, params: dict, timeout: float = 60.0) -> dict:
+    """fit in a worker, the fit is aborted after **timeout** seconds
+
+    Returns:
+        dict: params, errors, success, chisqr, redchi, best_fit and message
+    """
+    func = resolve(model)
+    deadline = time.time() + timeout
+    try:
+        result = func.fit(np.asarray(y), **({func.model.independent_vars[0]: np.asarray(x)} | params),
+                          iter_cb=lambda *args, **kwds: time.time() > deadline)
+    except Exception as e:
+        return {'success': False, 'message': f'{type(e).__name__}: {e}'}
+    return {'params': {k: v.value for k, v in result.params.items()},
+            'errors': {k: v.stderr for k, v in result.params.items()},
+            'success': bool(result.success and not result.aborted),
+            'chisqr': result.chisqr,
+            'redchi': result.redchi,
+            'best_fit': result.best_fit,
+            'message': f'TimeoutError: {timeout}s' if result.aborted else result.message}
+
+
+def fit_parallel(model: str | SymbolicFunction, jobs: dict, timeout: float = 60.0, workers: int | None = None):
+    """Fit many traces in a pool of processes, results are yielded as they complete
+
+    The pool is kept and reused, its workers have the models built already(see `warmup`).
 
-RB = SymbolicFunction('RB',
-                      'A * p**t + B',
-                      ['t'])
+    ***Example***
+    >>> jobs = {q: (t, data[q], {'T1': 20e-6}) for q in qubits}  # missing parameters are guessed
+    >>> for q, r in fit_parallel('T1', jobs, timeout=10):
+    ...     print(q, r['params']['T1'] if r['success'] else r['message'])
+
+    Args:
+        model (str | SymbolicFunction): name of a built-in model, or a model
+        jobs (dict): {key: (x, y, params)}, params are passed to **fit**
+        timeout (float, optional): timeout of each fit in seconds. Defaults to 60.0.
+        workers (int | None, optional): number of processes. Defaults to the number of CPUs.
+
+    Yields:
+        tuple: key and the result, see `fit_one`
+    """
+    import multiprocessing as mp
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor, as_completed
 
-Sin = SymbolicFunction('Sin',
-                       'A * sin(2 * pi * f * t + phi) + B',
-                       ['t'])
+    global _executor, _workers
 
-Gauss = SymbolicFunction('Gauss',
-                         'A * exp(-((t - mu) / sigma)**2 / 2)',
-                         ['t'])
+    if isinstance(model, SymbolicFunction):
+        spec = (model.name, model.formula, model.vars, model.guess)
+        try:
+            pickle.dumps(spec)
+        except Exception as e:
+            spec = spec[:3] + (None,)  # guess must be defined in a module
+        model = spec
+
+    workers = workers or os.cpu_count()
+    if _executor is None or _workers != workers:
+        shutdown()
+        # never fork, other threads(e.g. the sender of the viewer) may hold locks
+        method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+        _executor = ProcessPoolExecutor(workers, mp_context=mp.get_context(method),
+                                        initializer=warmup, initargs=(list(MODELS),))
+        _workers = workers
+
+    futures = {_executor.submit(fit_one, model, x, y, params, timeout): key
+               for key, (x, y, params) in jobs.items()}
+    for future in as_completed(futures):
+        try:
+            yield futures[future], future.result()
+        except Exception as e:
+            yield futures[future], {'success': False, 'message': f'{type(e).__name__}: {e}'}
 
-Lorentzian = SymbolicFunction('Lorentzian',
-                              '(A*Gamma/2) / ((Gamma/2)**2 + (omega - omega0)**2)',
-                              ['omega'])
 
 if __name__ == '__main__':
     s21d = np.array([0])
@@ -157,4 +554,4 @@ if __name__ == '__main__':
                   A=1,
                   B=0)
     params['f'] = f
-    result = S21.fit(np.abs(s21d), **params)
+    result = __getattr__('S21').fit(np.abs(s21d), **params)
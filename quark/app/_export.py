@@ -0,0 +1,138 @@
+# MIT License
+
+# Copyright (c) 2021 YL Feng <fengyulong@pku.org.cn>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from ._db import COLUMNS, Dataset, get_record_page
+
+
+def records(ids: list[int] = [], **filters):
+    """Records to be exported, given by ids or filters(see `get_record_page`)"""
+    if ids:
+        from ._db import get_record_list_by_rids, get_record_list_by_tids
+        return get_record_list_by_rids([i for i in ids if i < 1e10]) + \
+            get_record_list_by_tids([i for i in ids if i >= 1e10])
+
+    rows, cursor = [], None
+    while True:
+        page, cursor = get_record_page(COLUMNS, 1000, cursor, desc=False, **filters)
+        rows.extend(page)
+        if cursor is None:
+            return rows
+
+
+def totable(record: tuple, info: dict, data: dict[str, Dataset], params: list[str] = []):
+    """Flatten a record into a table, one row per point of the sweep
+
+    Columns:
+        - tid, name, date, index: record and index of the point
+        - loop.variable: sweep coordinates from meta['axis']
+        - signal: data, `.real` and `.imag` for complex, a list for each point if not a scalar
+        - path: parameters from the snapshot
+
+    Returns:
+        pyarrow.Table: table of the record
+    """
+    import pyarrow as pa
+
+    from ._snapshot import lookup, store
+
+    rows = max((ds.rows for ds in data.values()), default=0)
+    index = np.arange(rows)
+    columns = {'tid': np.full(rows, int(record[1]), np.int64),
+               'name': [record[2].split('/')[-1]] * rows,
+               'date': [str(record[9])[:10]] * rows,
+               'index': index}
+
+    sweep = next(iter(data.values())).sweep if data else ()
+    if rows and len(sweep) == len(info['meta'].get('axis', {})):
+        points = np.unravel_index(index, sweep)
+        for dim, (group, variables) in enumerate(info['meta']['axis'].items()):
+            for var, value in variables.items():
+                value = np.asarray(value)
+                if value.ndim == 1 and len(value) == sweep[dim]:
+                    columns[f'{group}.{var}'] = value[points[dim]]
+
+    for key, ds in data.items():
+        raw = ds.read(index[:ds.rows]) if ds.rows else np.zeros((0, *ds.rshape), ds.dtype)
+        raw = np.concatenate([raw, np.zeros((rows - ds.rows, *ds.rshape), ds.dtype)])
+        parts = {f'{key}.real': raw.real, f'{key}.imag': raw.imag} if np.iscomplexobj(raw) else {key: raw}
+        for name, value in parts.items():
+            if value.ndim == 1:
+                columns[name] = value
+            else:
+                flat = np.ascontiguousarray(value).reshape(rows, -1)
+                columns[name] = pa.FixedSizeListArray.from_arrays(flat.ravel(), flat.shape[1])
+
+    if params:
+        snapshot = store.snapshot(int(record[1]))
+        for path in params:
+            try:
+                value = lookup(snapshot, path)
+            except Exception as e:
+                value = None
+            value = value if isinstance(value, (int, float, str, type(None))) else str(value)
+            columns[path] = [value] * rows
+
+    return pa.table(columns)
+
+
+def export(root: str | Path, ids: list[int] = [], params: list[str] = [], **filters) -> list[int]:
+    """Export records to a parquet dataset partitioned by name and date, record by record.
+
+    Args:
+        root (str | Path): directory of the dataset
+        ids (list[int], optional): tids or rids. Defaults to [].
+        params (list[str], optional): parameters in the snapshot, e.g. 'Q0.Measure.frequency'. Defaults to [].
+
+    Keyword Arguments: filters
+        see `get_record_page`, used if no ids given
+
+    Returns:
+        list[int]: tids exported
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError('pyarrow is required, try `pip install pyarrow`') from e
+
+    from quark.proxy import HOME
+
+    from ._db import get_datasets_by_file
+
+    exported = []
+    for record in records(ids, **filters):
+        tid, filename, dataset = int(record[1]), record[7], record[8]
+        try:
+            filename = str(HOME / f'dat/{Path(filename).name}')
+            for _, info, data in get_datasets_by_file(filename, [dataset], lazy=True):
+                table = totable(record, info, data, params)
+            pq.write_to_dataset(table, root, partition_cols=['name', 'date'],
+                                basename_template=f'{tid}-{{i}}.parquet',
+                                existing_data_behavior='overwrite_or_ignore')
+            exported.append(tid)
+        except Exception as e:
+            logger.error(f'Failed to export {tid}: {e}')
+    return exported
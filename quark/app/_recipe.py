@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
+import ast
 import inspect
 import json
 import sys
@@ -92,12 +93,22 @@ class Recipe(object):
 
         self.__circuit: list[list] = []  # qlisp线路
 
-        self.__rules: list[str] = []  # 变量依赖关系列表
-        self.__loops: dict[str, list] = {}  # 变量列表
+        self.__rules: dict[str, str] = {}  # 变量依赖关系, 以路径为键
+        self.__loops: dict[str, dict[str, tuple]] = {}  # 变量列表, 以组及变量为键
 
         self.__ckey = ''
         self.__dict = {}
 
+    @property
+    def loops(self) -> dict[str, list[tuple]]:
+        """变量列表, 形如{group: [(target, value, unit), ...]}"""
+        return {group: list(variables.values()) for group, variables in self.__loops.items()}
+
+    @property
+    def rules(self) -> list[str]:
+        """变量依赖关系列表"""
+        return list(self.__rules.values())
+
     @property
     def circuit(self):
         return self.__circuit
@@ -177,10 +188,12 @@ class Recipe(object):
             path (str): 变量在cfg表中的完整路径, 如gate.R.Q1.params.amp
             value (Any, optional): 变量的值. Defaults to None.
 
-        Examples: `self.__rules`
+        Examples: `self.rules`
             >>> self.assign('gate.R.Q0.params.frequency', value='freq.Q0')
             >>> self.assign('gate.R.Q1.params.amp', value=0.1)
             ['⟨gate.R.Q0.params.frequency⟩=⟨freq.Q0⟩', '⟨gate.R.Q1.params.amp⟩=0.1']
+
+            同一路径重复赋值时, 以最后一次为准
         """
         if isinstance(value, str):
             if '.' in value and value.split('.')[0] in self.__loops:
@@ -190,8 +203,9 @@ class Recipe(object):
         else:
             dep = f'⟨{path}⟩={value}'
 
-        if dep not in self.__rules:
-            self.__rules.append(dep)
+        if self.__rules.get(path) != dep:  # 重新赋值的规则移至末尾, 与追加时的顺序一致
+            self.__rules.pop(path, None)
+            self.__rules[path] = dep
 
     def define(self, group: str, target: str, value: list | np.ndarray):
         """增加变量target到组group中
@@ -201,7 +215,7 @@ class Recipe(object):
             target (str): 变量对应的标识符号, 任意即可.
             value (list | np.array): 变量对应的取值范围.
 
-        Examples: `self.__loops`
+        Examples: `self.loops`
             >>> self.define('freq', 'Q0', array([2e6, 1e6,  0. ,  1e6,  2e6]))
             >>> self.define('freq', 'Q1', array([-3e6, -1.5e6,  0. ,  1.5e6,  3e6]))
             >>> self.define('amps', 'Q0', array([-0.2, -0.1,  0. ,  0.1,  0.2]))
@@ -210,18 +224,25 @@ class Recipe(object):
              'amps':[('Q0',array([-0.2, -0.1,  0. ,  0.1,  0.2]), 'au')), ('Q1',array([-0.24, -0.12,  0. ,  0.12,  0.24]), 'au'))]
             }
         """
-        self.__loops.setdefault(group, [])
-        var = (target, value, 'au')
-
-        if var not in self.__loops[group]:
-            self.__loops[group].append(var)
+        variables = self.__loops.setdefault(group, {})
+        if target in variables and variables[target][1] is value:
+            return
+        variables[target] = (target, value, 'au')  # 同一变量重复定义时, 以最后一次为准
 
-        dims = [len(d) for k, d, u in self.__loops[group]]
+        dims = [len(d) for k, d, u in variables.values()]
         assert len(set(dims)) == 1, f'{target} in {group}: wrong dims {dims}!'
 
-    def export(self):
+    def compile(self) -> list[tuple]:
+        """预编译的变量依赖关系, 详见**compile_rules**"""
+        return compile_rules(self.rules, self.loops)
+
+    def export(self, compact: bool = False):
         """导出任务
 
+        Args:
+            compact (bool, optional): 等间隔(linspace/arange)、等比(geomspace)及与同组变量相差常数的
+                变量以描述符形式导出(见**compress**), 由服务端展开(见**expand**). Defaults to False.
+
         Returns:
             _type_: 任务描述，详见**submit**
         """
@@ -241,7 +262,7 @@ class Recipe(object):
                                    'timeout': float(self.timeout),
                                    #   'precompile': self.prestep,
                                    'waveform_length': self.waveform_length,
-                                   'shape': [len(v[0][1]) for v in self.__loops.values()],
+                                   'shape': [len(v[0][1]) for v in self.loops.values()],
                                    } | {k: v for k, v in self.__dict.items() if not isinstance(v, (list, np.ndarray))}
                          },
                 'body': {'step': {'main': ['WRITE', tuple(self.__loops)],
@@ -251,7 +272,169 @@ class Recipe(object):
                          #  'init': self.initcmd,
                          #  'post': self.postcmd,
                          'cirq': self.circuit,
-                         'rule': self.__rules,
-                         'loop': {} | self.__loops
+                         'rule': self.rules,
+                         'compiled': self.compile(),
+                         'loop': compress(self.loops) if compact else self.loops
                          },
                 }
+
+
+def parse(rule: str) -> tuple[str, str | None, object]:
+    """解析变量依赖关系
+
+    Examples: 返回(路径, 变量, 值)
+        >>> parse('⟨gate.R.Q0.params.frequency⟩=⟨freq.Q0⟩')
+        ('gate.R.Q0.params.frequency', 'freq.Q0', None)
+        >>> parse('⟨gate.R.Q1.params.amp⟩=0.1')
+        ('gate.R.Q1.params.amp', None, 0.1)
+    """
+    path, value = rule[1:].split('⟩=', 1)
+    if value.startswith('⟨') and value.endswith('⟩'):
+        return path, value[1:-1], None
+    if value.startswith('"') and value.endswith('"'):
+        return path, None, value[1:-1]
+    try:
+        return path, None, ast.literal_eval(value)
+    except Exception as e:
+        return path, None, value
+
+
+def compile_rules(rules: list[str], loops: dict[str, list]) -> list[tuple]:
+    """将变量依赖关系预编译为(path, source, value), 使每步的参数更新只需按下标从变量中取值(见**gather**)
+
+    - source为(组下标, 变量下标)时, 取对应变量的值, value为None
+    - source为None时, value为常量
+    - 以$开头的变量直接写入对应路径
+
+    Args:
+        rules (list[str]): 变量依赖关系列表
+        loops (dict[str, list]): 变量列表
+
+    Returns:
+        list[tuple]: 预编译的依赖关系
+
+    Raises:
+        KeyError: 依赖的变量未定义(如组名或变量名有误)
+    """
+    index = {}
+    for i, (group, variables) in enumerate(loops.items()):
+        for j, (target, value, unit) in enumerate(variables):
+            index[f'{group}.{target}'] = (i, j)
+
+    compiled = [(target[1:], index[f'{group}.{target}'], None)
+                for group, variables in loops.items()
+                for target, value, unit in variables if target.startswith('$')]
+    for rule in rules:
+        path, source, value = parse(rule)
+        if source is None:
+            compiled.append((path, None, value))
+        elif source in index:
+            compiled.append((path, index[source], None))
+        else:
+            raise KeyError(source)
+    return compiled
+
+
+def gather(loops: dict[str, list], compiled: list[tuple], steps: np.ndarray) -> dict:
+    """根据预编译的依赖关系, 一次取出多步的参数
+
+    Args:
+        loops (dict[str, list]): 变量列表
+        compiled (list[tuple]): 预编译的依赖关系, 见**compile_rules**
+        steps (np.ndarray): 每步各组的下标, 形如(步数, 组数)
+
+    Returns:
+        dict: {path: 各步的值}, 常量不随步数展开
+    """
+    steps = np.asarray(steps)
+    values = [[np.asarray(value) for target, value, unit in variables] for variables in loops.values()]
+
+    result = {}
+    for path, source, value in compiled:
+        if source is None:
+            result[path] = value
+        else:
+            i, j = source
+            result[path] = values[i][j][steps[..., i]]
+    return result
+
+
+def describe(value: np.ndarray, others: dict[str, np.ndarray] = {}, rtol: float = 1e-12):
+    """描述符, 若无法描述返回None
+
+    Args:
+        value (np.ndarray): 变量取值
+        others (dict[str, np.ndarray], optional): 同组中已有的变量. Defaults to {}.
+        rtol (float, optional): 展开后与原值的相对误差. Defaults to 1e-12.
+
+    Examples: 描述符
+        >>> describe(np.linspace(0, 1, 101))
+        {'linspace': [0.0, 1.0, 101]}
+        >>> describe(np.geomspace(1, 1000, 4))
+        {'geomspace': [1.0, 1000.0, 4]}
+        >>> describe(np.linspace(0, 1, 101) + 5e9, {'Q0': np.linspace(0, 1, 101)})
+        {'offset': ['Q0', 5000000000.0]}
+    """
+    try:
+        value = np.asarray(value)
+        if value.ndim != 1 or len(value) < 3 or value.dtype.kind not in 'iuf':
+            return
+
+        def close(spec: dict):
+            expanded = expand({'': [('', spec, '')]}, others)[''][0][1]
+            atol = rtol * np.max(np.abs(value))
+            return expanded.dtype == value.dtype and np.allclose(expanded, value, rtol, atol)
+
+        start, stop, n = value[0].item(), value[-1].item(), len(value)
+        step = (value[1] - value[0]).item()
+        end = start + n * step if value.dtype.kind in 'iu' else start + (n - 0.5) * step  # n points exactly
+        for spec in [{'linspace': [start, stop, n]},
+                     {'arange': [start, end, step]},
+                     {'geomspace': [start, stop, n]}]:
+            try:
+                if close(spec):
+                    return spec
+            except Exception as e:
+                continue
+        for target, other in others.items():
+            if isinstance(other, np.ndarray) and other.shape == value.shape:
+                spec = {'offset': [target, (value[0] - other[0]).item()]}
+                if close(spec):
+                    return spec
+    except Exception as e:
+        return
+
+
+def compress(loops: dict[str, list]) -> dict[str, list]:
+    """以描述符替换可描述的变量取值(见**describe**)"""
+    result = {}
+    for group, variables in loops.items():
+        result[group], others = [], {}
+        for target, value, unit in variables:
+            spec = describe(value, others)
+            if spec is None:
+                others[target] = np.asarray(value)
+            result[group].append((target, value if spec is None else spec, unit))
+    return result
+
+
+SPACES = {'linspace': np.linspace, 'arange': np.arange, 'geomspace': np.geomspace}  # 可用的描述符
+
+
+def expand(loops: dict[str, list], others: dict[str, np.ndarray] = {}) -> dict[str, list]:
+    """展开描述符(见**describe**), 仅限**SPACES**及offset"""
+    result = {}
+    for group, variables in loops.items():
+        result[group], values = [], dict(others)
+        for target, value, unit in variables:
+            if isinstance(value, dict):
+                (kind, args), = value.items()
+                if kind == 'offset':
+                    value = values[args[0]] + args[1]
+                elif kind in SPACES:
+                    value = SPACES[kind](*args)
+                else:
+                    raise ValueError(f'{target} in {group}: unknown descriptor {kind}!')
+            values[target] = value
+            result[group].append((target, value, unit))
+    return result
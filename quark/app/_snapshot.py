@@ -0,0 +1,495 @@
+# MIT License
+
+# Copyright (c) 2021 YL Feng <fengyulong@pku.org.cn>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import hashlib
+import sqlite3
+import time
+from copy import copy
+from numbers import Number
+from pathlib import Path
+from threading import Lock, RLock
+
+import numpy as np
+from loguru import logger
+from srpc import loads
+from zee import FixedDict
+
+from ._cache import FINAL
+
+
+MISSING = type('Missing', (object,), {'__repr__': lambda self: 'MISSING'})()
+
+
+def digest(value, memo: dict | None = None) -> bytes:
+    """Content hash of a (nested) value
+
+    Args:
+        value (Any): dict, list, np.ndarray or any value with a stable repr
+        memo (dict | None, optional): digests of dicts keyed by id, updated in place. Defaults to None.
+
+    Returns:
+        bytes: sha1 digest
+    """
+    if isinstance(value, dict):
+        memo = {} if memo is None else memo
+        try:
+            return memo[id(value)][1]
+        except KeyError:
+            pass
+        h = hashlib.sha1(b'dict')
+        for k, v in value.items():  # order matters, which is stable for cfg
+            h.update(f'\0{k!r}\0'.encode())
+            h.update(digest(v, memo) if isinstance(v, (dict, list, tuple, np.ndarray))
+                     else f'{type(v).__name__}:{v!r}'.encode())
+        memo[id(value)] = (value, h.digest())  # keep value alive, id not reused
+    elif isinstance(value, (list, tuple)):
+        h = hashlib.sha1(type(value).__name__.encode())
+        for v in value:
+            h.update(b'\0')
+            h.update(digest(v, memo))
+    elif isinstance(value, np.ndarray):
+        h = hashlib.sha1(f'{value.dtype.str}{value.shape}'.encode())
+        h.update(np.ascontiguousarray(value).tobytes()
+                 if value.dtype != object else repr(value.tolist()).encode())
+    else:
+        h = hashlib.sha1(f'{type(value).__name__}:{value!r}'.encode())
+    return h.digest()
+
+
+def pack(tasks: list[dict], paths: list[str] = ['base', 'meta.other.lib', 'body.loop.*.*.1', 'body.rule']):
+    """Replace fields shared by more than one task with references to a table keyed by their digests
+
+    Args:
+        tasks (list[dict]): tasks exported by `Recipe`
+        paths (list[str], optional): dot-separated fields to be shared, `*` for all keys(or items
+            of a list), e.g. 'body.loop.*.*.1' for the values of each variable in the loops.
+            Defaults to ['base', 'meta.other.lib', 'body.loop.*.*.1', 'body.rule'].
+
+    Returns:
+        tuple: packed tasks(shallow copies) and the table of shared values, `{hexdigest: value}`
+    """
+    def fields(tree: dict | list | tuple, keys: list[str]):
+        if not isinstance(tree, (dict, list, tuple)) or not keys:
+            return
+        k, *rest = keys
+        if isinstance(tree, dict):
+            found = list(tree) if k == '*' else [k] if k in tree else []
+        else:
+            found = range(len(tree)) if k == '*' else [int(k)] if k.isdigit() and int(k) < len(tree) else []
+        for key in found:
+            if rest:
+                yield from (((key, *p), v) for p, v in fields(tree[key], rest))
+            else:
+                yield (key,), tree[key]
+
+    def replace(tree: dict | list | tuple, keys: tuple, value):
+        """copy on write"""
+        k, *rest = keys
+        value = replace(tree[k], rest, value) if rest else value
+        if isinstance(tree, tuple):
+            return tree[:k] + (value,) + tree[k + 1:]
+        tree = copy(tree)
+        tree[k] = value
+        return tree
+
+    memo, found = {}, []
+    for task in tasks:
+        found.append({p: (digest(v, memo).hex(), v) for path in paths
+                      for p, v in fields(task, path.split('.'))})
+
+    counts = {}
+    for digests in found:
+        for h in {h for h, v in digests.values()}:
+            counts[h] = counts.get(h, 0) + 1
+
+    refs, packed = {}, []
+    for task, digests in zip(tasks, found):
+        for path, (h, value) in digests.items():
+            if counts[h] < 2:
+                continue
+            refs.setdefault(h, value)
+            task = replace(task, path, {'$ref': h})
+        packed.append(copy(task))
+    return packed, refs
+
+
+def unpack(task: dict, refs: dict) -> dict:
+    """Resolve the references in a task packed by `pack`"""
+    if isinstance(task, dict):
+        if len(task) == 1 and '$ref' in task:
+            return refs[task['$ref']]
+        return {k: unpack(v, refs) for k, v in task.items()}
+    elif isinstance(task, (list, tuple)):
+        return type(task)(unpack(v, refs) for v in task)
+    return task
+
+
+class SnapshotStore(object):
+    """Parsed snapshots of cfg, shared by all records committed with the same content
+
+    - a git blob is read and parsed only once(cached by the hexsha of the blob)
+    - subtrees are interned by their digests, identical subtrees of different snapshots are the same object
+    """
+
+    def __init__(self, maxlen: int = 256, maxnodes: int = 1_000_000):
+        """
+        Args:
+            maxlen (int, optional): maximum number of parsed snapshots. Defaults to 256.
+            maxnodes (int, optional): maximum number of interned subtrees. Defaults to 1_000_000.
+        """
+        self.maxnodes = maxnodes
+
+        self.__blobs = FixedDict(maxlen=maxlen)  # blob hexsha -> snapshot
+        self.__commits = {}  # (repo, commit hexsha) -> (blob hexsha, blob)
+        self.__pool = {}  # digest -> subtree
+        self.__memo = {}  # id(subtree) -> (subtree, digest)
+        self.__lock = Lock()
+
+    @property
+    def memo(self) -> dict:
+        """Digests of the interned subtrees keyed by id. **Read only**"""
+        return self.__memo
+
+    def intern(self, tree: dict) -> dict:
+        """Replace subtrees by the identical ones in the pool
+
+        Args:
+            tree (dict): parsed snapshot
+
+        Returns:
+            dict: interned snapshot
+        """
+        if not isinstance(tree, dict):
+            return tree
+
+        with self.__lock:
+            if len(self.__pool) > self.maxnodes:
+                self.__pool.clear()
+                self.__memo.clear()
+            return self._intern(tree)
+
+    def _intern(self, tree: dict) -> dict:
+        if id(tree) in self.__memo:
+            return tree
+
+        node = {k: self._intern(v) if isinstance(v, dict) else v
+                for k, v in tree.items()}
+        key = digest(node, self.__memo)
+        pooled = self.__pool.setdefault(key, node)
+        if pooled is not node:
+            self.__memo.pop(id(node))
+        return pooled
+
+    def resolve(self, record: tuple):
+        """Blob of the cfg committed with a record
+
+        Args:
+            record (tuple): row of the task table
+
+        Returns:
+            tuple: hexsha of the blob and the blob
+        """
+        from quark.proxy import HOME
+
+        from ._db import get_repo
+
+        ckpt, hexsha = record[5], record[-1]
+        file: Path = (HOME / f'cfg/{ckpt}').with_suffix('.json')
+        repo = get_repo(file.resolve().parent)
+
+        key = (str(repo.working_dir), hexsha)
+        try:
+            return self.__commits[key]
+        except KeyError:
+            blob = repo.commit(hexsha).tree[file.name]
+            return self.__commits.setdefault(key, (blob.hexsha, blob))
+
+    def load(self, blob: tuple) -> dict:
+        hexsha, blob = blob
+        try:
+            return self.__blobs[hexsha]
+        except KeyError:
+            snapshot = self.intern(loads(blob.data_stream.read().decode()))
+            self.__blobs[hexsha] = snapshot
+            return snapshot
+
+    def snapshot(self, tid: int) -> dict:
+        """Snapshot of cfg of a task. **Do not modify it**, it is shared by the cache.
+
+        Args:
+            tid (int): task id
+
+        Returns:
+            dict: cfg
+        """
+        from ._db import get_record_by_tid
+
+        return self.load(self.resolve(get_record_by_tid(tid)))
+
+    def query(self, path: str, tids: list[int]) -> dict:
+        """Value of a parameter in the snapshots of many tasks
+
+        Args:
+            path (str): dot-separated keys like 'Q0.Measure.frequency'
+            tids (list[int]): task ids
+
+        Returns:
+            dict: {tid: value}, None if not found
+        """
+        from ._db import get_record_list_by_tids
+
+        records = {int(r[1]): r for r in get_record_list_by_tids(tids)}
+
+        result = {}
+        for tid in tids:
+            try:
+                result[tid] = lookup(self.load(self.resolve(records[int(tid)])), path)
+            except Exception as e:
+                logger.warning(f'Failed to get {path} of {tid}: {e}')
+                result[tid] = None
+        return result
+
+    def clear(self):
+        with self.__lock:
+            self.__blobs.clear()
+            self.__commits.clear()
+            self.__pool.clear()
+            self.__memo.clear()
+
+
+def changes(new: dict, old: dict, ignore: list[str] = [], memo: dict | None = None, prefix: str = ''):
+    """Leaves that differ between two nested dicts. Subtrees with the same digest are skipped without being visited.
+
+    Args:
+        new (dict): new snapshot
+        old (dict): old snapshot
+        ignore (list[str], optional): paths containing any of them are ignored. Defaults to [].
+        memo (dict | None, optional): digests of dicts keyed by id, see `digest`. Defaults to None.
+        prefix (str, optional): path of the subtree. Defaults to ''.
+
+    Yields:
+        tuple: path, old value and new value(`MISSING` if not found), an empty subtree added
+            or removed is given as a whole
+    """
+    if prefix and any(s in prefix for s in ignore):
+        return
+    memo = {} if memo is None else memo
+
+    if isinstance(new, dict) and isinstance(old, dict):
+        if new is old or digest(new, memo) == digest(old, memo):
+            return
+        for k in [*new, *(k for k in old if k not in new)]:
+            yield from changes(new.get(k, MISSING), old.get(k, MISSING), ignore, memo,
+                               f'{prefix}.{k}' if prefix else str(k))
+    elif isinstance(new, dict) or isinstance(old, dict):  # leaf <-> subtree
+        if (isinstance(new, dict) and not new) or (isinstance(old, dict) and not old):
+            yield prefix, old, new  # empty subtree, no leaves to compare
+            return
+        if not isinstance(old, dict) and old is not MISSING:
+            yield prefix, old, MISSING
+        if not isinstance(new, dict) and new is not MISSING:
+            yield prefix, MISSING, new
+        yield from changes(new if isinstance(new, dict) else {},
+                           old if isinstance(old, dict) else {},
+                           ignore, memo, prefix)
+    elif new is MISSING or old is MISSING:
+        yield prefix, old, new
+    elif not same(new, old):
+        yield prefix, old, new
+
+
+def same(new, old) -> bool:
+    """Whether two leaves are equal"""
+    try:
+        if isinstance(new, np.ndarray) and isinstance(old, np.ndarray):
+            return new.shape == old.shape and bool(np.all(new == old))
+        return not (new != old)
+    except Exception as e:
+        return False
+
+
+def delta(new: dict, old: dict, memo: dict | None = None) -> dict:
+    """Changes from **old** to **new** as a nested dict, see `patch`
+
+    Subtrees changed in both are given recursively, other changed values are given as they are,
+    removed keys are listed in `'$del'`.
+
+    Args:
+        new (dict): new snapshot
+        old (dict): old snapshot
+        memo (dict | None, optional): digests of dicts keyed by id, see `digest`. Defaults to None.
+
+    Returns:
+        dict: delta, empty if nothing changed
+    """
+    memo = {} if memo is None else memo
+
+    result = {}
+    for k, v in new.items():
+        o = old.get(k, MISSING)
+        if isinstance(v, dict) and isinstance(o, dict):
+            if v is not o and digest(v, memo) != digest(o, memo):
+                result[k] = delta(v, o, memo)
+        elif o is MISSING or isinstance(o, dict) or not same(v, o):
+            result[k] = v
+    removed = [k for k in old if k not in new]
+    if removed:
+        result['$del'] = removed
+    return result
+
+
+def patch(old: dict, delta: dict) -> dict:
+    """Apply a delta given by `delta`, **old** is not modified(unchanged subtrees are shared)"""
+    new = copy(old)
+    for k in delta.get('$del', []):
+        new.pop(k, None)
+    for k, v in delta.items():
+        if k == '$del':
+            continue
+        if isinstance(v, dict) and isinstance(old.get(k), dict):
+            new[k] = patch(old[k], v)
+        else:
+            new[k] = v
+    return new
+
+
+def lookup(tree: dict, path: str):
+    """Get value from a nested dict by dot-separated keys"""
+    for k in path.split('.'):
+        tree = tree[k]
+    return tree
+
+
+class HistoryIndex(object):
+    """Time series of parameters extracted from the snapshots of records
+
+    The index(`HOME/history.db`) is updated incrementally, only records newer than
+    the last indexed one are parsed for each tracked path.
+
+    ***Example***
+    >>> index.track('Q0.Measure.frequency')  # or `history` in quark.json
+    >>> index.history('Q0.Measure.frequency')['value']
+    """
+
+    def __init__(self, path: str | Path = ''):
+        self.__path = Path(path) if path else None
+        self.__db = None
+        self.__lock = RLock()
+
+    def db(self):
+        if self.__db is None:
+            from quark.proxy import HOME, QUARK
+            self.__db = sqlite3.connect(str(self.__path or HOME / 'history.db'),
+                                        check_same_thread=False)
+            self.__db.executescript('''
+                create table if not exists paths (path text primary key, last integer);
+                create table if not exists history (path text, tid integer, created text, value real, text text,
+                                                    primary key (path, tid));
+                ''')
+            self.track(*QUARK.get('history', []))
+        return self.__db
+
+    def track(self, *paths: str):
+        """Add parameters to the index, e.g. 'Q0.Measure.frequency'"""
+        with self.__lock:
+            self.db().executemany('insert or ignore into paths values (?, 0)',
+                                  [(p,) for p in paths])
+            self.db().commit()
+
+    @property
+    def paths(self) -> dict:
+        return dict(self.db().execute('select path, last from paths').fetchall())
+
+    def update(self, batch: int = 1000, grace: float = 86400.0):
+        """Index the records committed since the last update
+
+        Args:
+            batch (int, optional): number of records parsed at a time. Defaults to 1000.
+            grace (float, optional): records still running(not committed) are waited for, unless
+                created more than **grace** seconds ago(e.g. left by a crashed server), which are
+                skipped. Defaults to 86400.0.
+        """
+        from ._db import db
+
+        with self.__lock:
+            paths = self.paths
+            if not paths:
+                return
+            last = min(paths.values())
+            stale = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - grace))
+            while True:
+                records = db().execute('select * from task where id > ? order by id limit ?',
+                                       (last, batch)).fetchall()
+                rows = []
+                for i, record in enumerate(records):
+                    try:
+                        snapshot = store.load(store.resolve(record))
+                    except Exception as e:
+                        if record[6] in FINAL or str(record[9]) < stale:
+                            continue  # never committed
+                        records = records[:i]  # to be committed
+                        break
+                    for path, _last in paths.items():
+                        if record[0] <= _last:
+                            continue
+                        try:
+                            value = lookup(snapshot, path)
+                        except Exception as e:
+                            continue
+                        number = isinstance(value, Number) and not isinstance(value, complex)
+                        rows.append((path, record[1], record[9],
+                                     float(value) if number else None,
+                                     None if number else repr(value)))
+                if not records:
+                    break
+                last = records[-1][0]
+                self.db().executemany('insert or replace into history values (?, ?, ?, ?, ?)', rows)
+                self.db().executemany('update paths set last = ? where path = ? and last < ?',
+                                      [(last, p, last) for p in paths])
+                self.db().commit()
+                if len(records) < batch:
+                    break
+
+    def history(self, path: str, start: str = '', end: str = '') -> np.ndarray:
+        """History of a parameter, the path is tracked from now on if not yet
+
+        Args:
+            path (str): dot-separated keys like 'Q0.Measure.frequency'
+            start (str, optional): created after. Defaults to ''.
+            end (str, optional): created before. Defaults to ''.
+
+        Returns:
+            np.ndarray: structured array with fields tid, created, value(nan if not a number)
+                and text(repr of the value if not a number, None otherwise)
+        """
+        if path not in self.paths:
+            self.track(path)
+        self.update()
+
+        rows = self.db().execute('select tid, created, value, text from history where path = ? and created >= ? and created <= ? order by tid',
+                                 (path, start, end or '\uffff')).fetchall()
+        return np.array([(t, c, np.nan if v is None else v, x) for t, c, v, x in rows],
+                        dtype=[('tid', 'i8'), ('created', 'U32'), ('value', 'f8'), ('text', 'O')])
+
+
+store = SnapshotStore()
+index = HistoryIndex()
@@ -32,29 +32,33 @@ import matplotlib.pyplot as plt
 import numpy as np
 from srpc import loads
 
-from ._db import get_record_list_by_name, get_record_set_by_name
+from ._db import (COLUMNS, count_records, get_record_page,
+                  get_record_set_by_name)
 
 
-def query(app: str = None, start: datetime = None, end: datetime = None, page: int = 1) -> tuple:
-    """query records from database
+def query(app: str = None, start: datetime = None, end: datetime = None, page: int = 1, size: int = 100) -> tuple:
+    """query records from database, newest first
 
     Args:
         app (str, optional): task name. Defaults to None.
         start (datetime, optional): start time. Defaults to None.
         end (datetime, optional): end time. Defaults to None.
         page (int, optional): page number. Defaults to 1.
+        size (int, optional): number of records per page. Defaults to 100.
 
     Returns:
-        tuple: header, table content, pages, task names
+        tuple: header, table content(one page), pages(or task names if no app given)
     """
     print(app, start, end, page)
     if not app:
         return [], [], [r[0] for r in get_record_set_by_name()]
-    records = get_record_list_by_name(app, start.strftime(
-        '%Y-%m-%d-%H-%M-%S'), end.strftime('%Y-%m-%d-%H-%M-%S'))
-    headers = ['id', 'tid', 'name', 'user', 'priority', 'system', 'status',
-               'filename', 'dataset', 'created', 'finished', 'committed']
-    return headers, records[::-1], {}
+
+    filters = {'name': app,
+               'start': start.strftime('%Y-%m-%d-%H-%M-%S'),
+               'end': end.strftime('%Y-%m-%d-%H-%M-%S')}
+    records, _ = get_record_page(COLUMNS, size, offset=(page - 1) * size, **filters)
+    pages = (count_records(**filters) + size - 1) // size
+    return list(COLUMNS), records, {'page': page, 'pages': pages}
 
 
 def update(rid: int, tags: str):
@@ -101,7 +105,11 @@ def load(rid: int):
     return fig.data
 
 
-def history(path: str = 'Q0.Spectrum') -> np.ndarray:
+def history(path: str = 'Q0.Spectrum', cfg: bool = False) -> np.ndarray:
+    if cfg:  # parameter in cfg, e.g. Q0.Measure.frequency
+        from ._snapshot import index
+        return index.history(path)['value']
+
     try:
         import run
         run = reload(run)
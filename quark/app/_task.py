@@ -25,6 +25,7 @@ import textwrap
 import time
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from copy import deepcopy
 from functools import cached_property
 from threading import current_thread
 
@@ -89,6 +90,106 @@ class Progress(tqdm):
         # self.set_description_str(str(success))
 
 
+class Buffer(object):
+    """Growable ndarray for the points of a task, filled in place.
+
+    The first dimension is the index of the point. The capacity is preallocated if known
+    (e.g. from `meta['other']['shape']`), otherwise it grows by doubling.
+    Slicing returns a view of the valid points.
+
+    ***Example***
+    >>> buf = Buffer(capacity=100)
+    >>> buf.extend([np.zeros(2), np.ones(2)])
+    >>> buf[:].shape
+    (2, 2)
+    """
+
+    def __init__(self, capacity: int = 0):
+        """
+        Args:
+            capacity (int, optional): number of points to be preallocated. Defaults to 0.
+        """
+        self.capacity = int(capacity)
+        self.size = 0
+        self.__data: np.ndarray | None = None
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.view[key]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.view if dtype is None else self.view.astype(dtype)
+
+    def __repr__(self):
+        return f'Buffer(size={self.size}, capacity={self.capacity})'
+
+    @property
+    def view(self) -> np.ndarray:
+        """valid points, **not** a copy"""
+        if self.__data is None:
+            return np.empty((0,))
+        return self.__data[:self.size]
+
+    def reserve(self, capacity: int):
+        """make room for **capacity** points"""
+        self.capacity = max(self.capacity, int(capacity))
+        if self.__data is not None and len(self.__data) < self.capacity:
+            self.allocate(self.__data.shape[1:], self.__data.dtype)
+
+    def allocate(self, shape: tuple, dtype: np.dtype):
+        data = np.empty((max(self.capacity, 1), *shape), dtype)
+        if self.__data is not None:
+            if self.__data.shape[1:] == shape:
+                data[:self.size] = self.__data[:self.size]
+            else:  # ragged, dtype is object
+                data[:self.size] = stack(self.__data[:self.size], ragged=True)
+        self.__data = data
+        self.capacity = len(data)
+
+    def extend(self, values: list | np.ndarray):
+        """append points to the end
+
+        Args:
+            values (list | np.ndarray): points, stacked along the first dimension
+        """
+        if not len(values):
+            return
+        values = stack(values)
+
+        if self.__data is None:
+            self.allocate(values.shape[1:], values.dtype)
+        elif self.__data.dtype == object and self.__data.ndim == 1:  # ragged already, no reallocation
+            if values.dtype != object or values.ndim != 1:
+                values = stack(values, ragged=True)
+        elif self.__data.shape[1:] != values.shape[1:]:
+            values = stack(values, ragged=True)
+            self.allocate((), object)
+        elif np.result_type(values.dtype, self.__data.dtype) != self.__data.dtype:
+            self.allocate(values.shape[1:], np.result_type(values.dtype, self.__data.dtype))
+
+        end = self.size + len(values)
+        if end > self.capacity:
+            self.capacity = max(end, 2 * self.capacity)
+            self.allocate(self.__data.shape[1:], self.__data.dtype)
+        self.__data[self.size:end] = values
+        self.size = end
+
+
+def stack(values: list | np.ndarray, ragged: bool = False) -> np.ndarray:
+    """stack points along the first dimension, a 1D object array if the points are ragged"""
+    try:
+        if not ragged:
+            return np.asarray(values)
+    except ValueError as e:
+        pass
+    array = np.empty(len(values), object)
+    for i, v in enumerate(values):
+        array[i] = v
+    return array
+
+
 class Task(object):
     """Interact with `QuarkServer` from the view of a `Task`, including tracking progress, getting result, plotting and debugging
     """
@@ -96,6 +197,10 @@ class Task(object):
     handles = {}
     counter = defaultdict(lambda: 0)
     server = None
+    streams = {}  # id(server) -> whether `subscribe` is supported
+    bases = {}  # id(server) -> (hexdigest, base) submitted last time
+    deltas = {}  # id(server) -> whether `$delta` is supported
+    mindelay = 0.1  # minimum delay of polling
 
     def __init__(self, task: dict, timeout: float | None = None, plot: bool = False) -> None:
         """instantiate a task
@@ -109,7 +214,7 @@ class Task(object):
         self.timeout = timeout
         self.plot = plot
 
-        self.data: dict[str, np.ndarray] = {}  # retrieved data from server
+        self.data: dict[str, Buffer] = {}  # retrieved data from server
         self.meta = {}  # meta info like axis
         self.index = 0  # index of data already retrieved
         self.last = 0  # last index of retrieved data
@@ -183,18 +288,82 @@ class Task(object):
         try:
             from ._db import reshape
             shape = self.meta['other']['shape']
-            data = {k: reshape(np.asarray(v), shape)
-                    for k, v in self.data.items()}
+            data = {k: reshape(v, shape) for k, v in self.points.items()}
         except Exception as e:
             logger.error(f'Failed to reshape data: {e}')
-            data = self.data
+            data = self.points
         return {'data': data} | {'meta': self.meta}
 
-    def run(self):
+    @property
+    def points(self) -> dict[str, np.ndarray]:
+        """retrieved points, views of the buffers"""
+        return {k: v[:] for k, v in self.data.items()}
+
+    def run(self, delta: bool = False):
         """submit the task to the `QuarkServer`
+
+        Args:
+            delta (bool, optional): send the base as a delta against the one submitted last time if True
+                and the server has acknowledged that base, the full base otherwise. Defaults to False.
         """
         self.stime = time.time()  # start time
-        self.tid = self.server.submit(self.task)  # , keep=True)
+        if not delta or not isinstance(self.task.get('base'), dict):
+            self.tid = self.server.submit(self.task)  # , keep=True)
+            return
+
+        from ._snapshot import digest
+
+        current = digest(self.task['base']).hex()
+        if id(self.server) in self.bases and self.acknowledged(self.bases[id(self.server)][0]):
+            tid = self.server.submit(self.encode(current))
+            if isinstance(tid, int):
+                self.tid = tid
+                self.bases[id(self.server)] = (current, deepcopy(self.task['base']))
+                return
+            logger.debug(f'Failed to submit delta({tid}), submitting full base')
+        self.tid = self.server.submit(self.task)
+        self.bases[id(self.server)] = (current, deepcopy(self.task['base']))
+
+    def acknowledged(self, ref: str) -> bool:
+        """whether the server keeps the base **ref** and accepts deltas against it
+
+        Tip: protocol
+            `server.delta(ref)` returns True only if a delta against **ref** can be applied.
+            Any other reply(e.g. an error of an unknown method) means `$delta` is not supported,
+            a task with a delta would otherwise run with the literal `{'$delta': ...}` as its base.
+        """
+        if not self.deltas.get(id(self.server), True):
+            return False
+
+        try:
+            ack = self.server.delta(ref)
+        except Exception as e:
+            ack = str(e)
+        if isinstance(ack, bool):
+            self.deltas[id(self.server)] = True
+            return ack
+
+        logger.debug(f'$delta not supported({ack}), submitting full base')
+        self.deltas[id(self.server)] = False
+        return False
+
+    def encode(self, current: str) -> dict:
+        """task with the base replaced by a delta against the base submitted last time
+
+        Tip: protocol
+            `{'$delta': {'ref': hexdigest of the last base, 'digest': hexdigest of the base, 'diff': ...}}`,
+            the server reconstructs the base by `patch(last base, diff)` and checks the digest,
+            and replies an error if the last base is unknown or the digest mismatches.
+
+        Args:
+            current (str): hexdigest of the base
+        """
+        from ._snapshot import delta
+
+        ref, last = self.bases[id(self.server)]
+        return self.task | {'base': {'$delta': {'ref': ref,
+                                                'digest': current,
+                                                'diff': delta(self.task['base'], last)}}}
 
     def raw(self, sid: int):
         return self.server.track(self.tid, sid, raw=True)
@@ -227,12 +396,21 @@ class Task(object):
         return r
 
     def process(self, data: list[dict]):
+        try:
+            size = int(np.prod(self.meta['other']['shape']))
+        except Exception as e:
+            size = 0
+
+        points = defaultdict(list)
         for dat in data:
             for k, v in dat.items():
-                if k in self.data:
-                    self.data[k].append(v)
-                else:
-                    self.data[k] = [v]
+                points[k].append(v)
+
+        for k, v in points.items():
+            if k not in self.data:
+                self.data[k] = Buffer(size)
+            self.data[k].reserve(size)
+            self.data[k].extend(v)
 
     def fetch(self):
         """result of the task
@@ -241,31 +419,97 @@ class Task(object):
         res = self.server.fetch(self.tid, start=self.index, meta=meta)
 
         if isinstance(res, str):
-            return self.data
+            return self.points
         elif isinstance(res, tuple):
             if isinstance(res[0], str):
-                return self.data
-            data, self.meta = res
+                return self.points
+            data, meta = res
         else:
-            data = res
+            data, meta = res, {}
+        self.apply(data, meta)
+
+        return self.points
+
+    def apply(self, data: list[dict], meta: dict = {}):
+        """merge new data(and meta) retrieved from the server
+
+        Args:
+            data (list[dict]): new points since `self.index`
+            meta (dict, optional): meta info, only sent once. Defaults to {}.
+        """
+        append = bool(self.meta)
+        if meta:
+            self.meta = meta
         self.last = self.index
         self.index += len(data)
-        # data.clear()
         self.process(data)
 
         if self.plot:
             from ._viewer import plot
-            plot(self, not meta)
+            plot(self, append)
+
+    def subscribe(self, timeout: float = 0.0) -> str | None:
+        """wait(at most **timeout** seconds) for new data or a status transition,
+        status and data are delivered in one round trip.
+
+        Tip: protocol
+            `server.subscribe(tid, start, meta, timeout)` returns once new points after **start** are
+            produced, the status changes or the timeout expires, e.g.
+            >>> {'status': 'Running', 'data': [...], 'meta': {...}}
+
+        Args:
+            timeout (float, optional): timeout of long polling, 0 to return immediately. Defaults to 0.0.
 
-        return self.data
+        Returns:
+            str | None: status of the task, None if not supported by the server
+        """
+        if not self.streams.get(id(self.server), True):
+            return
 
-    def update(self):
         try:
-            self.fetch()
+            res = self.server.subscribe(self.tid, start=self.index, meta=not self.meta, timeout=timeout)
         except Exception as e:
-            logger.error(f'Failed to fetch result: {e}')
+            res = e
+        if isinstance(res, dict) and 'status' in res:
+            self.streams[id(self.server)] = True
+            self.apply(res.get('data', []), res.get('meta', {}))
+            return res['status']
+
+        if id(self.server) not in self.streams:
+            logger.debug(f'subscribe not supported({res}), polling instead')
+        self.streams[id(self.server)] = False
+
+    def poll(self, timeout: float = 0.0) -> str:
+        """retrieve new data and status, see `subscribe`(`fetch` and `status` if not supported)
 
-        status = self.status()['status']
+        Returns:
+            str: status of the task
+        """
+        status = self.subscribe(timeout)
+        if status is None:
+            try:
+                self.fetch()
+            except Exception as e:
+                logger.error(f'Failed to fetch result: {e}')
+            status = self.status()['status']
+        return status
+
+    def update(self, timeout: float = 0.0):
+        index = self.index
+        return self.transit(self.poll(timeout), index)
+
+    def transit(self, status: str, index: int):
+        """update the progress according to the status
+
+        Args:
+            status (str): status of the task
+            index (int): `self.index` before new data retrieved
+
+        Returns:
+            bool: True if the task is done
+        """
+        self.changed = self.index != index or status != getattr(self, 'state', '')
+        self.state = status
 
         if status in ['Failed', 'Canceled']:
             self.stop(self.tid, False)
@@ -281,6 +525,15 @@ class Task(object):
             self.fetch()
             return True
 
+    def backoff(self, interval: float) -> float:
+        """delay before the next poll, reset on changes and doubled otherwise(at most **interval**)"""
+        delay = getattr(self, 'delay', 0)
+        if getattr(self, 'changed', True) or not delay:
+            self.delay = min(self.mindelay, interval)
+        else:
+            self.delay = min(2 * delay, interval)
+        return self.delay
+
     def clear(self):
         self.counter.clear()
         for tid, handle in self.handles.items():
@@ -297,11 +550,12 @@ class Task(object):
         """task progress. 
 
         Tip: tips
-            - Reduce the interval if result is empty.
+            - Data are pushed by the server as soon as they are produced if `subscribe` is supported,
+              otherwise the server is polled with a delay growing from 0.1s up to **interval**.
             - If timeout is not None or not 0, task will be blocked, otherwise, the task will be executed asynchronously.
 
         Args:
-            interval (float, optional): time period to retrieve data from `QuarkServer`. Defaults to 2.0.
+            interval (float, optional): maximum time period to retrieve data from `QuarkServer`. Defaults to 2.0.
             disable (bool, optional): disable the progress bar. Defaults to False.
             leave (bool, optional): whether to leave the progress bar after completion. Defaults to True
 
@@ -312,7 +566,8 @@ class Task(object):
             try:
                 status = self.status()['status']
                 if status in ['Pending']:
-                    time.sleep(interval)
+                    time.sleep(self.backoff(interval))
+                    self.changed = False
                     continue
                 elif status == 'Canceled':
                     return 'Task canceled!'
@@ -329,14 +584,20 @@ class Task(object):
                 if not hasattr(self.progress, 'disp'):
                     break
 
+        self.changed = True
         if isinstance(self.timeout, float):
             while True:
                 if self.timeout > 0 and (time.time() - self.stime > self.timeout):
                     msg = f'Timeout: {self.timeout}'
                     logger.warning(msg)
                     raise TimeoutError(msg)
-                time.sleep(interval)
-                if self.update():
+                if self.streams.get(id(self.server), True):
+                    # long polling, returns as soon as anything changes
+                    done = self.update(interval)
+                else:
+                    time.sleep(self.backoff(interval))
+                    done = self.update()
+                if done:
                     break
         else:
             self.progress.clear()
@@ -345,11 +606,143 @@ class Task(object):
 
     def refresh(self, interval: float = 2.0):
         self.progress.display()
-        if self.update():
+        if self.update():  # never block the event loop
             self.progress.display()
             return
         self.handles[self.tid] = asyncio.get_running_loop(
-        ).call_later(interval, self.refresh, *(interval,))
+        ).call_later(self.backoff(interval), self.refresh, *(interval,))
+
+
+class TaskGroup(object):
+    """Track many tasks with one batched request per tick instead of a few per task
+
+    ***Example***
+    >>> group = TaskGroup([s.submit(rcp.export()) for rcp in recipes])
+    >>> group.bar()
+    >>> group[tid].result()
+
+    Tip: protocol
+        `server.poll([(tid, start, meta), ...])` returns a list of
+        `{'status': ..., 'data': [...], 'meta': {...}}` in the same order.
+        Tasks on a server without `poll` are updated one by one(see `Task.update`).
+    """
+
+    batched = {}  # id(server) -> whether `poll` is supported
+
+    def __init__(self, tasks: list[Task] = []):
+        """
+        Args:
+            tasks (list[Task], optional): submitted tasks. Defaults to [].
+        """
+        self.tasks: dict[int, Task] = {}
+        self.done: set[int] = set()
+        self.handle = None
+        self.delay = 0
+        for task in tasks:
+            self.add(task)
+
+    def __getitem__(self, tid: int) -> Task:
+        return self.tasks[tid]
+
+    def __iter__(self):
+        return iter(self.tasks.values())
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __repr__(self):
+        return f'TaskGroup(tasks={len(self.tasks)}, done={len(self.done)})'
+
+    def add(self, task: Task):
+        self.tasks[task.tid] = task
+
+    def remove(self, tid: int):
+        self.tasks.pop(tid, None)
+        self.done.discard(tid)
+
+    def progress(self, task: Task, status: str, disable: bool = False, leave: bool = True):
+        if hasattr(task, 'progress') or status in ['Pending']:
+            return
+        try:
+            total = task.report(False)['size']
+        except Exception as e:
+            total = 0
+        task.progress = Progress(desc=str(task), total=total, postfix=status,
+                                 disable=disable, leave=leave,
+                                 position=list(self.tasks).index(task.tid))
+
+    def tick(self, disable: bool = False, leave: bool = True) -> bool:
+        """retrieve the status and new data of all tasks
+
+        Returns:
+            bool: True if anything changed
+        """
+        servers = defaultdict(list)
+        for tid, task in self.tasks.items():
+            if tid not in self.done:
+                servers[id(task.server)].append(task)
+
+        changed = False
+        for tasks in servers.values():
+            server = tasks[0].server
+            try:
+                if not self.batched.get(id(server), True):
+                    raise AttributeError('poll not supported')
+                res = server.poll([(t.tid, t.index, not t.meta) for t in tasks])
+                assert isinstance(res, list) and len(res) == len(tasks), f'unexpected reply {res}'
+                self.batched[id(server)] = True
+            except Exception as e:
+                if id(server) not in self.batched:
+                    logger.debug(f'poll not supported({e}), updating one by one')
+                self.batched[id(server)] = False
+                res = [None] * len(tasks)
+
+            for task, payload in zip(tasks, res):
+                try:
+                    index = task.index
+                    if isinstance(payload, dict) and 'status' in payload:
+                        task.apply(payload.get('data', []), payload.get('meta', {}))
+                        status = payload['status']
+                    else:
+                        status = task.poll()
+                    self.progress(task, status, disable, leave)
+                    if not hasattr(task, 'progress'):
+                        continue
+                    if task.transit(status, index):
+                        task.progress.close()
+                        self.done.add(task.tid)
+                    changed |= task.changed
+                except Exception as e:
+                    logger.error(f'Failed to update {task}: {e}')
+        return changed
+
+    def bar(self, interval: float = 2.0, block: bool = True, disable: bool = False, leave: bool = True):
+        """progress of all tasks
+
+        Args:
+            interval (float, optional): maximum time period to retrieve data from `QuarkServer`. Defaults to 2.0.
+            block (bool, optional): wait until all tasks are done if True, otherwise refresh in the event loop. Defaults to True.
+            disable (bool, optional): disable the progress bars. Defaults to False.
+            leave (bool, optional): whether to leave the progress bars after completion. Defaults to True.
+        """
+        while len(self.done) < len(self.tasks):
+            if self.tick(disable, leave) or not self.delay:
+                self.delay = min(Task.mindelay, interval)
+            else:
+                self.delay = min(2 * self.delay, interval)
+            if not block:
+                self.handle = asyncio.get_running_loop().call_later(
+                    self.delay, self.bar, *(interval, block, disable, leave))
+                return
+            time.sleep(self.delay)
+
+    def cancel(self):
+        """cancel all tasks"""
+        if self.handle:
+            self.handle.cancel()
+        for tid, task in self.tasks.items():
+            if tid not in self.done:
+                task.cancel()
 
 
 class TaskMixin(ABC):
@@ -21,16 +21,154 @@
 
 
 import time
+from collections import deque
+from threading import Condition, Event, Thread
 
 import numpy as np
 from loguru import logger
 from srpc import connect
 
 from . import ping
+from ._cache import FINAL
 from ._task import Task
 
-_vs = {'viewer': connect('QuarkViewer', port=2086),
-       'studio': connect('QuarkViewer', port=1086)}
+
+class Throttle(object):
+    """Frame rate limited by the measured render time
+
+    A frame is sent only if the previous one has been rendered for a while(EMA of the
+    time spent by the viewer), new data are merged into the next frame otherwise.
+    """
+
+    def __init__(self, mininterval: float = 0.05, alpha: float = 0.3):
+        """
+        Args:
+            mininterval (float, optional): minimum interval between frames. Defaults to 0.05.
+            alpha (float, optional): smoothing factor of the render time. Defaults to 0.3.
+        """
+        self.mininterval = mininterval
+        self.alpha = alpha
+        self.cost = 0.0  # render time
+        self.last = 0.0  # end of the last frame
+
+    def ready(self) -> bool:
+        return time.time() - self.last >= max(self.cost, self.mininterval)
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.last = time.time()
+        self.cost += self.alpha * (self.last - self.start - self.cost)
+
+
+class Viewer(object):
+    """Lazy connection to QuarkViewer(or QuarkStudio)
+
+    Nothing is connected until the first call. Calls(plot, append, clear, ...) return at once,
+    they are queued(bounded, the oldest dropped if full) and sent by a background thread, which
+    also keeps the health state up to date and reconnects if the viewer is gone. A `plot`
+    supersedes the frames(plot, append) queued before it, other calls are kept in order.
+    """
+
+    def __init__(self, port: int, maxsize: int = 32, interval: float = 5.0):
+        """
+        Args:
+            port (int): port of the viewer
+            maxsize (int, optional): maximum number of queued calls. Defaults to 32.
+            interval (float, optional): interval of health checks. Defaults to 5.0.
+        """
+        self.port = port
+        self.interval = interval
+        self.alive = False  # health state, updated by the sender
+        self.checked = Event()  # set once the health state is known
+        self.throttle = Throttle()  # render time of the frames
+
+        self.__conn = None
+        self.__queue = deque(maxlen=maxsize)
+        self.__cond = Condition()
+        self.__thread = None
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwds: self.put(name, args, kwds)
+
+    def put(self, name: str, args: tuple = (), kwds: dict = {}):
+        with self.__cond:
+            if name == 'plot':
+                calls = [c for c in self.__queue if c[0] not in ['plot', 'append']]
+                self.__queue.clear()
+                self.__queue.extend(calls)
+            self.__queue.append((name, args, kwds))
+            self.__cond.notify()
+        self.start()
+
+    def healthy(self, timeout: float = 1.0) -> bool:
+        """cached health state, checked in the background
+
+        Args:
+            timeout (float, optional): time to wait for the first check. Defaults to 1.0.
+        """
+        self.start()
+        self.checked.wait(timeout)
+        return self.alive
+
+    def ready(self) -> bool:
+        """healthy, no frame queued and the last one rendered"""
+        with self.__cond:
+            busy = any(c[0] in ['plot', 'append'] for c in self.__queue)
+        return self.healthy() and not busy and self.throttle.ready()
+
+    def start(self):
+        with self.__cond:
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = Thread(target=self.run, name=f'viewer-{self.port}', daemon=True)
+                self.__thread.start()
+
+    def check(self) -> bool:
+        """(re)connect and ping the viewer"""
+        try:
+            if self.__conn is None:
+                self.__conn = connect('QuarkViewer', port=self.port)
+            self.alive = ping(self.__conn)
+        except Exception as e:
+            self.alive = False
+        if not self.alive:
+            self.__conn = None
+        self.checked.set()
+        return self.alive
+
+    def run(self):
+        while True:
+            if not self.alive and not self.check():
+                time.sleep(self.interval)  # queued calls are kept(bounded) until reconnected
+                continue
+
+            with self.__cond:
+                if not self.__queue:
+                    self.__cond.wait(self.interval)
+                call = self.__queue.popleft() if self.__queue else None
+            if call is None:
+                self.check()  # idle, refresh the health state
+                continue
+
+            name, args, kwds = call
+            try:
+                if name in ['plot', 'append']:
+                    with self.throttle:
+                        getattr(self.__conn, name)(*args, **kwds)
+                else:
+                    getattr(self.__conn, name)(*args, **kwds)
+            except Exception as e:
+                logger.error(f'Failed to {name} on viewer({self.port}): {e}')
+                self.alive = False
+                self.__conn = None
+
+
+_vs = {'viewer': Viewer(port=2086),
+       'studio': Viewer(port=1086)}
 
 
 class Figure(object):
@@ -69,7 +207,7 @@ class Figure(object):
         return self.axes
 
     def show(self):
-        self.backend.plot(self.data)
+        self.backend.plot([dict(cell) for cell in self.data])  # sent later, the figure may be cleared
 
 
 class Axes(object):
@@ -120,6 +258,176 @@ class Axes(object):
 fig = Figure()
 
 
+POINTS = 2000  # buckets of a curve, min and max of each bucket are kept
+PIXELS = 400  # columns of an image, averaged in blocks
+BINARY = False  # send arrays as raw bytes, see `encode`
+IQMODE = 'density'  # 'density' or 'scatter', overridden by `task.iqmode`
+COLORS = {0: (0, 0, 255), 1: (255, 0, 0), 2: (0, 160, 0)}  # RGB color for state 0,1,2
+
+
+def decimate(xdata: np.ndarray, ydata: np.ndarray, buckets: int = POINTS):
+    """min/max decimation of a curve, the envelope(spikes included) is kept
+
+    Args:
+        xdata (np.ndarray): 1D array
+        ydata (np.ndarray): 1D array, abs is used for complex data
+        buckets (int, optional): number of buckets. Defaults to POINTS.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: at most 2 * **buckets** points
+    """
+    size = int(np.ceil(len(ydata) / buckets))
+    if size <= 2:
+        return xdata, ydata
+
+    proxy = np.abs(ydata) if np.iscomplexobj(ydata) else np.asarray(ydata, float)
+    proxy = np.nan_to_num(proxy, nan=np.nanmean(proxy) if np.isfinite(proxy).any() else 0)
+    blocks = np.pad(proxy, (0, -len(proxy) % size), mode='edge').reshape(-1, size)
+    start = np.arange(len(blocks)) * size
+    index = np.sort(np.stack([start + blocks.argmin(1), start + blocks.argmax(1)], 1), 1)
+    index = np.unique(np.clip(index.ravel(), 0, len(ydata) - 1))
+    return xdata[index], ydata[index]
+
+
+def block(data: np.ndarray, size: int, axis: int = -1):
+    """mean of every **size** elements along **axis**"""
+    if size <= 1:
+        return data
+    data = np.moveaxis(np.asarray(data), axis, -1)
+    pad = [(0, 0)] * (data.ndim - 1) + [(0, -data.shape[-1] % size)]
+    data = np.pad(data, pad, mode='edge').reshape(*data.shape[:-1], -1, size)
+    return np.moveaxis(data.mean(-1), -1, axis)
+
+
+class Density(object):
+    """2D histogram of the shots in the IQ plane, accumulated frame by frame
+
+    The bins are of fixed width, new shots are added to the counts without binning the old
+    ones again. The range is extended if a shot falls outside, and adjacent bins are merged
+    in pairs if there are more than 2 * **bins** along an axis.
+    """
+
+    def __init__(self, bins: int = 100):
+        """
+        Args:
+            bins (int, optional): number of bins along each axis at first. Defaults to 100.
+        """
+        self.bins = bins
+        self.origin = None  # lower edges along I and Q
+        self.width = None  # widths of the bins along I and Q
+        self.shape = np.zeros(2, int)
+        self.counts = {}  # label(prepared state) -> counts of shape **shape**
+
+    def add(self, shots: np.ndarray, label: int | None = None):
+        """add the shots of one point
+
+        Args:
+            shots (np.ndarray): complex array
+            label (int | None, optional): prepared state of the point, see `image`. Defaults to None.
+        """
+        shots = np.asarray(shots).ravel()
+        shots = shots[np.isfinite(shots)]
+        if not len(shots):
+            return
+        xy = np.stack([shots.real, shots.imag], 1)
+
+        if self.origin is None:
+            low, high = xy.min(0), xy.max(0)
+            margin = 0.05 * max(np.ptp(xy, 0).max(), 1e-12)
+            self.origin = low - margin
+            self.width = (high - low + 2 * margin) / self.bins
+            self.shape[:] = self.bins
+
+        index = np.floor((xy - self.origin) / self.width).astype(int)
+        lower, upper = np.minimum(index.min(0), 0), np.maximum(index.max(0) + 1, self.shape)
+        if (lower < 0).any() or (upper > self.shape).any():  # range extended
+            pad = list(zip(-lower, upper - self.shape))
+            self.counts = {k: np.pad(h, pad) for k, h in self.counts.items()}
+            self.origin = self.origin + lower * self.width
+            self.shape = upper - lower
+            index -= lower
+            for axis in range(2):
+                while self.shape[axis] > 2 * self.bins:  # merged in pairs
+                    pairs = np.arange(0, self.shape[axis], 2)
+                    self.counts = {k: np.add.reduceat(h, pairs, axis) for k, h in self.counts.items()}
+                    self.width[axis] *= 2
+                    self.shape[axis] = len(pairs)
+                    index[:, axis] //= 2
+
+        h = np.bincount(index[:, 0] * self.shape[1] + index[:, 1], minlength=self.shape.prod())
+        if label in self.counts:
+            self.counts[label] += h.reshape(self.shape)
+        else:
+            self.counts[label] = h.reshape(self.shape)
+
+    def image(self, colors: dict[int, tuple] = {}):
+        """histogram of all the shots added
+
+        Args:
+            colors (dict[int, tuple], optional): RGB color of each label(white if missing), counts
+                are returned if not given. Defaults to {}.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: centers of the bins along I and Q, and
+                counts or RGB image of shape (*shape, 3)
+        """
+        xc, yc = (o + (np.arange(n) + 0.5) * w for o, n, w in zip(self.origin, self.shape, self.width))
+        if not colors:
+            return xc, yc, sum(self.counts.values())
+
+        z = np.zeros((*self.shape, 3))
+        for label, h in self.counts.items():
+            z += (h / max(h.max(), 1))[..., None] * colors.get(label, (255, 255, 255))
+        return xc, yc, np.clip(z, 0, 255).astype(np.uint8)
+
+
+def states(task: Task) -> list | None:
+    """prepared state of each point for the colors of `Density`
+
+    Given by `task.states`, or the values of the only axis if it is named after the state,
+    None if unknown or any of them has no color(see `COLORS`).
+    """
+    labels = getattr(task, 'states', None)
+    if labels is None:
+        try:
+            (name, axis), = task.meta['axis'].items()
+            assert 'state' in name.lower()
+            labels = next(iter(axis.values()))
+        except Exception as e:
+            return None
+    labels = np.asarray(labels).ravel()
+    if labels.dtype.kind not in 'iuf' or not np.isin(labels, list(COLORS)).all():
+        return None
+    return labels.astype(int).tolist()
+
+
+def encode(data):
+    """arrays in a frame to raw bytes(no conversion to lists), see `decode`
+
+    >>> {'$array': ('<f8', (400,)), 'bytes': b'...'}
+    """
+    if isinstance(data, np.ndarray) and data.dtype != object:
+        data = np.ascontiguousarray(data)
+        return {'$array': (data.dtype.str, data.shape), 'bytes': data.tobytes()}
+    elif isinstance(data, dict):
+        return {k: encode(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [encode(v) for v in data]
+    return data
+
+
+def decode(data):
+    """inverse of `encode`, for the viewer"""
+    if isinstance(data, dict):
+        if '$array' in data:
+            dtype, shape = data['$array']
+            return np.frombuffer(data['bytes'], dtype).reshape(shape)
+        return {k: decode(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [decode(v) for v in data]
+    return data
+
+
 def plot(task: Task, append: bool = False, backend: str = 'viewer'):
     """real time display of the result
 
@@ -128,7 +436,10 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
 
     Note: for better performance
         - subplot number should not be too large(6*6 at maximum) 
-        - data points should not be too many(5000 at maxmum)
+        - curves longer than 2 * `POINTS` are decimated(min/max per bucket)
+        - images wider than `PIXELS` are averaged in blocks along the inner axis, complete rows only
+        - frames are sent no faster than the viewer renders them, points in between are merged into the next frame
+        - shots of `iq` are accumulated into 2D histograms(colored by `states`), set `task.iqmode = 'scatter'` for the raw shots
 
     Tip: data structure of plot
         - [[dict]], namely a 2D list whose element is a dict
@@ -143,15 +454,20 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
         if backend == 'studio':
             viewer.clear()
 
-        if not ping(viewer):
-            task.plot = False
+        if not viewer.healthy():  # not running(yet), points are merged into the next frame
             return
 
     if 'population' in str(task.meta['other']['signal']):
         signal = 'population'
     else:
         signal = str(task.meta['other']['signal']).split('.')[-1]
-    raw = np.asarray(task.data[signal][task.last:task.index])
+    # points since the last frame sent, merged into one frame if the viewer is busy
+    start = min(getattr(task, 'drawn', 0), task.last) if append else task.last
+    if backend and start and getattr(task, 'state', '') not in FINAL and not viewer.ready():
+        return
+    append = append and start > 0
+    stop = task.index
+    raw = np.asarray(task.data[signal][start:stop])
 
     try:
         if signal == 'iq' and task.progress.total >= 5:
@@ -165,6 +481,17 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
         label = []
         xlabel, ylabel = 'real', 'imag'
         append = False
+        iqmode = getattr(task, 'iqmode', IQMODE)
+        if iqmode == 'density':  # shots since the last frame added to the histograms
+            if not hasattr(task, 'hists'):
+                task.hists, task.binned = {}, 0
+            labels = states(task)
+            raw = np.asarray(task.data[signal][task.binned:task.index])
+            for idx in range(raw.shape[-1]):
+                hist = task.hists.setdefault(idx, Density())
+                for i, shots in enumerate(raw[..., idx], task.binned):
+                    hist.add(shots, labels[i] if labels and i < len(labels) else None)
+            task.binned = task.index
     else:
         # raw = np.abs(raw)
 
@@ -177,7 +504,7 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
                 task.xdata = np.asarray(list(axis[xlabel].values())).T
                 if raw.shape[-1] + 1 == task.xdata.shape[-1]:
                     task.xdata = task.xdata[:, 1:]
-            xdata = task.xdata[task.last:task.index]
+            xdata = task.xdata[start:task.index]
             ydata = raw
         elif len(label) == 2:
             xlabel, ylabel = label
@@ -193,11 +520,24 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
             xdata = task.xdata
             ydata = task.ydata
             zdata = np.abs(raw)
+
+            n = len(ydata)  # points of a row(inner axis)
+            size = int(np.ceil(n / PIXELS)) if start % n == 0 else 1
+            if size > 1:  # complete rows averaged along the inner axis, the rest merged into the next frame
+                rows, rest = divmod(len(zdata), n)
+                if rest and getattr(task, 'state', '') in FINAL:  # never completed
+                    zdata = np.concatenate([zdata, np.full((n - rest, *zdata.shape[1:]), np.nan)])
+                    rows += 1
+                if not rows:
+                    return
+                zdata = zdata[:rows * n].reshape(rows, n, *zdata.shape[1:])
+                zdata = block(zdata, size, axis=1).reshape(-1, *zdata.shape[2:])
+                stop = min(start + rows * n, task.index)
         if len(label) > 3:  # 2D image at maximum
             return
 
     uname = f'{task.name}_{xlabel}'
-    if backend and task.last == 0:
+    if backend and start == 0:
         if uname not in task.counter or len(label) == 2 or signal == 'iq':
             viewer.clear()  # clear the canvas
             task.counter.clear()  # clear the task history
@@ -205,7 +545,6 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
             task.counter[uname] += 1
         viewer.info(task.task)
 
-    time.sleep(0.1)  # reduce the frame rate per second for better performance
     try:
         data = []
         for idx in range(raw.shape[-1]):
@@ -221,10 +560,22 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
             cell = {}  # one of the subplot
             line = {}
 
-            if signal == 'iq':  # scatter plot
+            if signal == 'iq' and iqmode == 'density':  # 2D histogram
+                try:
+                    xc, yc, zc = task.hists[idx].image(COLORS if labels else {})
+                    cell['density'] = {'xdata': xc,
+                                       'ydata': yc,
+                                       'zdata': zc,
+                                       'xlabel': xlabel,
+                                       'ylabel': ylabel,
+                                       'title': _title,
+                                       'colormap': 'hot'}
+                except Exception as e:
+                    continue
+            elif signal == 'iq':  # scatter plot
                 try:
                     for i, iq in enumerate(raw[..., idx]):
-                        si = i + task.last
+                        si = i + start
                         cell[si] = {'xdata': iq.real.squeeze(),
                                     'ydata': iq.imag.squeeze(),
                                     'xlabel': xlabel,
@@ -244,7 +595,9 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
                     except Exception as e:
                         line['xdata'] = xdata[..., 0].squeeze()
                     line['ydata'] = ydata[..., idx].squeeze()
-                    if task.last == 0:
+                    if line['xdata'].ndim == 1 and line['xdata'].shape == line['ydata'].shape:
+                        line['xdata'], line['ydata'] = decimate(line['xdata'], line['ydata'], POINTS)
+                    if start == 0:
                         line['linecolor'] = 'r'  # line color
                         line['linewidth'] = 2  # line width
                         line['fadecolor'] = (  # RGB color, hex to decimal
@@ -254,23 +607,23 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
 
             if len(label) == 2:  # 2D image
                 try:
-                    if task.last == 0:
+                    line['zdata'] = zdata[..., idx].squeeze()
+                    if start == 0:
                         try:
                             line['xdata'] = xdata[..., idx].squeeze()
                         except Exception as e:
                             line['xdata'] = xdata[..., 0].squeeze()
 
                         try:
-                            line['ydata'] = ydata[..., idx].squeeze()
+                            line['ydata'] = block(ydata[..., idx].squeeze(), size)
                         except Exception as e:
-                            line['ydata'] = ydata[..., 0].squeeze()
+                            line['ydata'] = block(ydata[..., 0].squeeze(), size)
                         # colormap of the image, see matplotlib
                         line['colormap'] = 'RdBu'
-                    line['zdata'] = zdata[..., idx].squeeze()
                 except Exception as e:
                     continue
 
-            if task.last == 0:
+            if start == 0:
                 line['title'] = _title
                 line['xlabel'] = xlabel
                 line['ylabel'] = ylabel
@@ -281,14 +634,15 @@ def plot(task: Task, append: bool = False, backend: str = 'viewer'):
         if not backend:
             return data
         if not append:
-            viewer.plot(data)  # create a new canvas
+            viewer.plot(encode(data) if BINARY else data)  # create a new canvas
         else:
-            viewer.append(data)  # append new data to the canvas
+            viewer.append(encode(data) if BINARY else data)  # append new data to the canvas
+        task.drawn = stop
     except Exception as e:
         logger.error(f'Failed to update viewer: {e}')
 
 
-def network():
+def network(backend: str = 'viewer'):
     nodes = {}
     edges = {}
     for i in range(12):
@@ -325,7 +679,7 @@ def network():
                                          'pen': (55, 123, 255, 180, 21),
                                          'value': {'b': np.random.random(1)[0] + 5, 'c': {'e': 134}, 'f': [(1, 2, 34)]}
                                          }
-    _vs.graph(dict(nodes=nodes, edges=edges))
+    _vs[backend].graph(dict(nodes=nodes, edges=edges))
 
 
 try:
@@ -404,9 +758,9 @@ def demo(dim: int = 1):
 
     Example: iq scatter
         ``` {.py3 linenums="1"}
-        _vs.clear()
+        _vs['studio'].clear()
         iq = np.random.randn(1024)+np.random.randn(1024)*1j
-        _vs.plot([
+        _vs['studio'].plot([
                 {'i':{'xdata':iq.real-3,'ydata':iq.imag,'linestyle':'none','marker':'o','markersize':15,'markercolor':'b'},
                 'q':{'xdata':iq.real+3,'ydata':iq.imag,'linestyle':'none','marker':'o','markersize':5,'markercolor':'r'},
                 'hist':{'xdata':np.linspace(-3,3,1024),'ydata':iq.imag,"fillvalue":0, 'fillcolor':'r'}
@@ -417,12 +771,12 @@ def demo(dim: int = 1):
 
     Example: hist
         ``` {.py3 linenums="1"}
-        _vs.clear()
+        _vs['studio'].clear()
         vals = np.hstack([np.random.normal(size=500), np.random.normal(size=260, loc=4)])
         # compute standard histogram, len(y)+1 = len(x)
         y,x = np.histogram(vals, bins=np.linspace(-3, 8, 40))
         data = [{'hist':{'xdata':x,'ydata':y,'step':'center','fillvalue':0,'fillcolor':'g','linewidth':0}}]
-        _vs.plot(data)
+        _vs['studio'].plot(data)
         ```
     """
     viewer = _vs['studio']
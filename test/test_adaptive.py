@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from quark.app._adaptive import Learner1D, Learner2D, adaptive, select, spec
+from quark.app._recipe import Recipe
+
+
+def peak(x: float) -> float:
+    return 1 / (1 + (x - 70) ** 2)
+
+
+def test_learner1d_refines_peak():
+    learner = Learner1D((0, 100))
+    for _ in range(10):
+        xs = learner.ask(8)
+        learner.tell_many(xs, [peak(x) for x in xs])
+    x = np.array(sorted(learner.data))
+    assert np.sum(np.abs(x - 70) < 10) > np.sum(np.abs(x - 20) < 10)
+    assert learner.loss() < np.inf
+
+
+def test_learner1d_resolution():
+    learner = Learner1D((0, 10), resolution=1)
+    for _ in range(20):
+        xs = learner.ask(4)
+        learner.tell_many(xs, [peak(7 * x) for x in xs])
+    assert np.min(np.diff(sorted(learner.data))) >= 1 - 1e-9
+    assert learner.loss() == 0
+
+
+def test_learner2d():
+    learner = Learner2D([(0, 10), (0, 10)])
+    xys = learner.ask(9)
+    assert len(xys) == 9
+    learner.tell_many(xys, [np.hypot(x - 7, y - 7) < 2 for x, y in xys])
+    xys = learner.ask(5)
+    assert len(xys) == 5 and all(0 <= x <= 10 and 0 <= y <= 10 for x, y in xys)
+    assert learner.loss() < np.inf
+
+
+@pytest.fixture
+def task():
+    rcp = Recipe('test')
+    rcp.define('freq', 'Q0', np.arange(5) * 1.0)
+    rcp.define('amp', 'Q0', np.arange(3) * 0.1)
+    rcp.define('amp', '$gate.R.Q0.amp', np.arange(3) * 0.2)
+    rcp.assign('gate.R.Q0.frequency', 'freq.Q0')
+    rcp.assign('gate.R.Q1.amp', 'amp.Q0')
+    return rcp.export()
+
+
+def test_select(task):
+    sub = select(task, ['freq', 'amp'], np.array([[0, 1], [4, 2]]))
+    assert list(sub['body']['loop']) == ['freq']
+    targets = {t: v for t, v, u in sub['body']['loop']['freq']}
+    assert targets['Q0'].tolist() == [0.0, 4.0]
+    assert np.allclose(targets['amp_Q0'], [0.1, 0.2])
+    assert np.allclose(targets['$gate.R.Q0.amp'], [0.2, 0.4])  # written to its path as before
+    assert '⟨gate.R.Q1.amp⟩=⟨freq.amp_Q0⟩' in sub['body']['rule']
+    assert sub['meta']['other']['shape'] == [2]
+
+
+def test_select_duplicated_path(task):
+    task['body']['loop']['freq'].append(('$gate.R.Q0.amp', np.arange(5) * 0.3, 'au'))
+    with pytest.raises(ValueError):
+        select(task, ['freq', 'amp'], np.array([[0, 1]]))
+
+
+def test_select_compact():
+    compact = Recipe('test')
+    compact.define('freq', 'Q0', np.linspace(0, 4, 5))
+    compact.define('amp', 'Q0', np.arange(3) * 0.1)
+    task = compact.export(compact=True)
+    assert isinstance(task['body']['loop']['freq'][0][1], dict)
+    assert spec(task, ['freq', 'amp'], 4, 2, 0.0)['shape'] == [5, 3]
+    sub = select(task, ['freq', 'amp'], np.array([[4, 2]]))
+    assert sub['body']['loop']['freq'][0][1].tolist() == [4.0]
+
+
+def test_adaptive_compact():
+    rcp = Recipe('test')
+    rcp.define('freq', 'Q0', np.linspace(0, 100, 101))
+    task = rcp.export(compact=True)
+    assert isinstance(task['body']['loop']['freq'][0][1], dict)
+
+    def submit(sub: dict, block: bool = False):
+        x = sub['body']['loop']['freq'][0][1]
+        assert sub['meta']['other']['adaptive']['shape'] == [101]
+        return SimpleNamespace(tid=1, bar=lambda disable: None,
+                               result=lambda: {'data': {'iq': np.array([peak(v) for v in x])}})
+
+    r = adaptive(task, npoints=8, rounds=4, submit=submit)
+    assert r['index'].max() > 1 and len(r['index']) == 32  # over the whole grid
+    assert np.array_equal(r['coords']['freq']['Q0'], r['index'][:, 0] * 1.0)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from quark.app._cache import ResultCache
+
+
+def result(n: int = 100):
+    return {'data': {'iq': np.arange(n, dtype=float)}, 'meta': {'n': n}, 'task': {}}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(maxbytes=2000, maxdisk=10**6, path=tmp_path / 'result')
+
+
+def test_only_final(cache):
+    cache.put(1, result(), 'Running')
+    cache.put(2, result(), None)
+    assert cache.get(1) is None and cache.get(2) is None
+
+    cache.put(3, result(), 'Finished')
+    assert 3 in cache
+    assert np.array_equal(cache.get(3)['data']['iq'], np.arange(100))
+
+
+def test_memory_limit(cache):
+    for tid in range(1, 4):  # 800 bytes each
+        cache.put(tid, result(), 'Finished')
+    cache.clear(disk=False)
+    cache.put(4, result(), 'Finished')
+    cache.put(5, result(), 'Finished')
+    cache.get(4)  # most recently used
+    cache.put(6, result(), 'Finished')
+    assert cache.get(4) is not None
+
+
+def test_disk(cache, tmp_path):
+    cache.put(1, result(), 'Finished')
+    other = ResultCache(maxdisk=10**6, path=tmp_path / 'result')
+    r = other.get(1)
+    assert isinstance(r['data']['iq'], np.memmap)
+    assert r['meta'] == {'n': 100}
+
+    r['data']['iq'][0] = -1  # copy on write
+    assert ResultCache(path=tmp_path / 'result').get(1)['data']['iq'][0] == 0
+
+
+def test_disk_limit(tmp_path):
+    cache = ResultCache(maxbytes=0, maxdisk=5000, path=tmp_path / 'result')
+    for tid in range(1, 7):  # about 1000 bytes each
+        cache.put(tid, result(), 'Finished')
+    assert 0 < cache.usage() <= 5000
+    assert cache.usage() == sum(size for _, size, _ in cache.scan())
+    assert 6 in cache and 1 not in cache
+
+    cache.clear()
+    assert cache.usage() == 0 and cache.get(6) is None
@@ -0,0 +1,170 @@
+import sqlite3
+
+import h5py
+import numpy as np
+import pytest
+from srpc import dumps
+
+import quark.proxy
+from quark.app import _db, get_data_by_ids
+from quark.app._cache import ResultCache
+from quark.app._db import COLUMNS, Dataset, count_records, get_record_page, reshape
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """3x4 sweep of points of shape (2,), the last 2 points are missing"""
+    filename = str(tmp_path / 'a.hdf5')
+    raw = np.arange(10 * 2, dtype=float).reshape(10, 2)
+    with h5py.File(filename, 'w') as f:
+        f['rec/iq'] = raw
+    axis = {'x': {'x': np.arange(3) * 10.0}, 'y': {'y': np.arange(4) * 0.5}}
+    full = np.zeros((12, 2))
+    full[:10] = raw
+    return Dataset(filename, 'rec', 'iq', (3, 4), axis), full.reshape(3, 4, 2)
+
+
+def test_dataset_shape(dataset):
+    d, full = dataset
+    assert d.shape == (3, 4, 2)
+    assert len(d) == 3
+    assert np.array_equal(np.asarray(d), full)
+
+
+@pytest.mark.parametrize('key', [0, -1, (1, 2), (slice(None), 3), (Ellipsis, 1),
+                                 [0, 2], (slice(None), [1, 3]), (slice(None, None, -1), 0),
+                                 np.array([True, False, True]), (2, slice(1, None), 0)])
+def test_dataset_index(dataset, key):
+    d, full = dataset
+    assert np.array_equal(d[key], full[key])
+
+
+@pytest.mark.parametrize('key', [3, -4, (slice(None), 4), (0, -5), [0, 3], np.array([True, False])])
+def test_dataset_out_of_range(dataset, key):
+    d, full = dataset
+    with pytest.raises(IndexError):
+        full[key]
+    with pytest.raises(IndexError):
+        d[key]
+
+
+def test_dataset_multiple_arrays(dataset):
+    d, full = dataset
+    with pytest.raises(IndexError):
+        d[[0, 2], [1, 3]]
+    assert np.array_equal(d.take(([0, 2], [1, 3])), full[np.ix_([0, 2], [1, 3])])
+
+
+def test_dataset_sel(dataset):
+    d, full = dataset
+    assert np.array_equal(d.sel(x=10.1), full[1])
+    assert np.array_equal(d.sel(x=[0, 20], y=slice(0.5, 1.0)), full[np.ix_([0, 2], [1, 2])])
+
+
+def test_reshape_complete_is_view():
+    raw = np.arange(6)
+    data = reshape(raw, (2, 3))
+    assert data.shape == (2, 3)
+    assert np.shares_memory(data, raw)
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'bool', 'uint16', 'float32', 'complex64'])
+def test_reshape_keeps_dtype(dtype):
+    data, valid = reshape(np.ones((4, 2), dtype), (2, 3), mask=True)
+    assert data.dtype == np.dtype(dtype)
+    assert data.shape == (2, 3, 2)
+    assert valid.tolist() == [[True, True, True], [True, False, False]]
+    assert not data[1, 1:].any()
+
+
+def test_reshape_fill():
+    data = reshape(np.ones(4, 'int8'), (2, 3), fill=np.nan)
+    assert data.dtype.kind == 'f'
+    assert np.isnan(data[1, 1:]).all() and (data[0] == 1).all()
+
+    data = reshape(np.ones(4, 'float32'), (2, 3), fill=np.nan)
+    assert data.dtype == np.float32
+
+    data = reshape(np.ones(4, 'uint8'), (2, 3), fill=-1)
+    assert data[1, 2] == -1
+
+
+@pytest.fixture
+def records(monkeypatch):
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f'create table task ({", ".join(COLUMNS)})')
+    for i in range(1, 26):
+        conn.execute(f'insert into task values ({", ".join("?" * len(COLUMNS))})',
+                     (i, 10**10 + i, f'test/{"s21" if i % 2 else "rabi"}', 'baqis', 0, 'chip',
+                      'Finished' if i % 5 else 'Failed', 'a.hdf5', f'rec{i}',
+                      f'2026-01-{i:02d} 00:00:00', f'2026-01-{i:02d} 00:01:00', ''))
+    monkeypatch.setattr(_db, 'db', lambda: conn)
+    return conn
+
+
+def test_record_page(records):
+    page, cursor = get_record_page(('id', 'tid'), size=10)
+    assert [r[0] for r in page] == list(range(25, 15, -1))
+    assert len(page[0]) == 2
+
+    ids = [r[0] for r in page]
+    while cursor is not None:
+        page, cursor = get_record_page(('id',), size=10, after=cursor)
+        ids.extend(r[0] for r in page)
+    assert ids == list(range(25, 0, -1))
+
+    page, cursor = get_record_page(('id',), size=10, offset=20, desc=False)
+    assert [r[0] for r in page] == [21, 22, 23, 24, 25] and cursor is None
+
+
+def test_record_filters(records):
+    page, _ = get_record_page(('id', 'status'), name='rabi', status='Failed')
+    assert [r[0] for r in page] == [20, 10]
+    page, _ = get_record_page(('id',), start='2026-01-03', end='2026-01-05', desc=False)
+    assert [r[0] for r in page] == [3, 4]
+    page, _ = get_record_page(('id',), tids=(10**10 + 7, 10**10 + 9), desc=False)
+    assert [r[0] for r in page] == [7, 8, 9]
+    assert count_records(status='Failed') == 5
+    assert get_record_page(('id', 'id; drop table task'), size=1)[0] == [(25,)]
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """records 1-5 in 2 files, the data of the 4th is missing, the 5th is still running"""
+    monkeypatch.setattr(quark.proxy, 'HOME', tmp_path)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('create table task (id integer, tid integer, name, user, priority, system, status, '
+                 'filename, dataset, created, finished, committed)')
+    monkeypatch.setattr(_db, 'db', lambda: conn)
+
+    (tmp_path / 'dat').mkdir()
+    for i in range(1, 6):
+        filename = 'a.hdf5' if i < 3 else 'b.hdf5'
+        conn.execute(f'insert into task values ({", ".join("?" * len(COLUMNS))})',
+                     (i, 10**10 + i, 'test', 'baqis', 0, 'chip', 'Running' if i == 5 else 'Finished',
+                      f'/elsewhere/{filename}', f'rec{i}', '', '', ''))
+        if i == 4:
+            continue
+        with h5py.File(tmp_path / 'dat' / filename, 'a') as f:
+            f[f'rec{i}/iq'] = np.full(4, i * 1.0)
+            f[f'rec{i}'].attrs['snapshot'] = dumps({'meta': {'other': {'shape': [2, 2]}, 'axis': {}}})
+    return tmp_path
+
+
+def test_data_by_ids(files):
+    cache = ResultCache(path=files / 'result')
+    results = dict(get_data_by_ids([10**10 + 1, 2, 3, 4, 5, 10**10 + 5, 10**10 + 9], workers=2, cache=cache))
+    assert sorted(results) == [2, 3, 5, 10**10 + 1, 10**10 + 5]
+    assert results[10**10 + 1]['data']['iq'].tolist() == [[1.0, 1.0], [1.0, 1.0]]
+    assert results[3]['data']['iq'].shape == (2, 2) and results[3]['meta']['other']['shape'] == [2, 2]
+    assert results[5] is results[10**10 + 5]  # same record read once
+
+    assert 10**10 + 1 in cache and 10**10 + 5 not in cache  # only final results are cached
+    (files / 'dat' / 'a.hdf5').unlink()
+    assert dict(get_data_by_ids([1], cache=cache))[1]['data']['iq'][0, 0] == 1.0  # from the cache
+
+
+def test_data_by_ids_lazy(files):
+    results = dict(get_data_by_ids([1, 3], lazy=True))
+    assert isinstance(results[1]['data']['iq'], Dataset)
+    assert np.asarray(results[3]['data']['iq']).tolist() == [[3.0, 3.0], [3.0, 3.0]]
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import quark.proxy
+
+from quark.app import _dp
+from quark.app._dp import SymbolicFunction, fit_parallel
+
+pytest.importorskip('sympy')
+
+
+def decay(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 100e-6, 101)
+    T1 = rng.uniform(10e-6, 40e-6, (2, 3))
+    data = 0.8 * np.exp(-t / T1[..., None]) + 0.1 + rng.normal(0, 1e-3, (2, 3, len(t)))
+    return t, T1, data
+
+
+def test_vars():
+    model = SymbolicFunction('line', 'k * x + b', ['x'])
+    assert model.vars == ['x']
+    model.vars.append('k')  # a copy
+    assert model.vars == ['x']
+
+
+def test_fit_many():
+    t, T1, data = decay()
+    r = _dp.T1.fit_many(data, t=t)  # guessed
+    assert r['success'].shape == (2, 3) and r['success'].all()
+    assert r['best_fit'].shape == data.shape
+    assert np.allclose(r['params']['T1'], T1, rtol=0.05)
+    assert np.allclose(r['params']['B'], 0.1, atol=0.01)
+
+
+def test_fit_many_axis():
+    t, T1, data = decay(1)
+    r = _dp.T1.fit_many(np.moveaxis(data, -1, 0), axis=0, t=t, B={'value': 0.1, 'vary': False})
+    assert r['params']['T1'].shape == (2, 3)
+    assert np.allclose(r['params']['T1'], T1, rtol=0.05)
+    assert (r['params']['B'] == 0.1).all()
+
+
+def test_fit_parallel():
+    t, T1, data = decay(2)
+    jobs = {i: (t, y, {}) for i, y in enumerate(data.reshape(-1, len(t))[:2])}
+    try:
+        results = dict(fit_parallel('T1', jobs, timeout=30, workers=1))
+        assert sorted(results) == [0, 1]
+        assert all(r['success'] for r in results.values())
+        assert np.isclose(results[0]['params']['T1'], T1.flat[0], rtol=0.05)
+        assert _dp._workers == 1
+    finally:
+        _dp.shutdown()
+
+
+def test_lazy_models():
+    assert 'T1' in dir(_dp)
+    assert _dp.T1 is _dp.T1  # built once
+    with pytest.raises(AttributeError):
+        _dp.T2
+
+
+def test_lambdify_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(quark.proxy, 'HOME', tmp_path)
+    model = SymbolicFunction('line', 'k * x + b', ['x'])
+    assert len(list(tmp_path.glob('cache/lambdify/*.json'))) == 1
+
+    cached = SymbolicFunction('line', 'k * x + b', ['x'])  # built from the source cached
+    assert cached.names == model.names
+    assert 'expr' not in cached.__dict__  # sympy not touched
+    x = np.arange(3.0)
+    assert np.allclose(cached.func(*[{'x': x, 'k': 2, 'b': 1}[n] for n in cached.names]), 2 * x + 1)
@@ -0,0 +1,62 @@
+import sqlite3
+
+import h5py
+import numpy as np
+import pytest
+from srpc import dumps
+
+import quark.proxy
+from quark.app import _db, _snapshot
+from quark.app._db import COLUMNS
+from quark.app._export import export
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """2x3 sweeps of rabi(5 points done, complex) and s21(a trace of 4 per point)"""
+    monkeypatch.setattr(quark.proxy, 'HOME', tmp_path)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('create table task (id integer, tid integer, name, user, priority, system, status, '
+                 'filename, dataset, created, finished, committed)')
+    monkeypatch.setattr(_db, 'db', lambda: conn)
+    monkeypatch.setattr(_snapshot.store, 'snapshot', lambda tid: {'Q0': {'f': tid % 10, 'g': [1, 2]}})
+
+    (tmp_path / 'dat').mkdir()
+    meta = {'other': {'shape': [2, 3]}, 'axis': {'amp': {'Q0': [0.1, 0.2]}, 'freq': {'Q0': [1, 2, 3]}}}
+    for i, (name, data) in enumerate([('rabi', np.arange(5) * (1 + 1j)),
+                                      ('s21', np.arange(24.0).reshape(6, 4))], 1):
+        conn.execute(f'insert into task values ({", ".join("?" * len(COLUMNS))})',
+                     (i, 10**10 + i, f'test/{name}', 'baqis', 0, 'chip', 'Finished', 'a.hdf5', f'rec{i}',
+                      f'2026-01-0{i} 00:00:00', '', ''))
+        with h5py.File(tmp_path / 'dat/a.hdf5', 'a') as f:
+            f[f'rec{i}/iq'] = data
+            f[f'rec{i}'].attrs['snapshot'] = dumps({'meta': meta})
+    return tmp_path
+
+
+def test_export(files):
+    root = files / 'parquet'
+    assert export(root, [1, 10**10 + 2, 10**10 + 9], params=['Q0.f', 'Q0.g', 'Q0.x']) == [10**10 + 1, 10**10 + 2]
+    assert sorted(p.name for p in root.iterdir()) == ['name=rabi', 'name=s21']
+    assert (root / 'name=rabi' / 'date=2026-01-01').is_dir()
+
+    rabi = pq.read_table(root / 'name=rabi').to_pydict()
+    assert rabi['index'] == list(range(5))  # points done only
+    assert rabi['amp.Q0'] == [0.1] * 3 + [0.2] * 2
+    assert rabi['freq.Q0'] == [1, 2, 3, 1, 2]
+    assert rabi['iq.real'] == rabi['iq.imag'] == [0, 1, 2, 3, 4]
+    assert rabi['Q0.f'] == [1] * 5 and rabi['Q0.g'][0] == '[1, 2]'
+    assert rabi['Q0.x'] == [None] * 5
+
+    s21 = pq.read_table(root / 'name=s21')
+    assert s21.num_rows == 6
+    assert s21.column('iq').to_pylist()[1] == [4.0, 5.0, 6.0, 7.0]
+
+
+def test_export_filters(files):
+    root = files / 'parquet'
+    assert export(root, name='rabi') == [10**10 + 1]
+    assert export(root, start='2026-01-02') == [10**10 + 2]
+    assert sorted(p.name for p in root.iterdir()) == ['name=rabi', 'name=s21']
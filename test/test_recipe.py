@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from quark.app._recipe import Recipe, compile_rules, compress, describe, expand, gather, parse
+
+
+@pytest.mark.parametrize('value, kind', [(np.linspace(0, 1, 101), 'linspace'),
+                                         (np.linspace(-20, 20, 401) * 1e6, 'linspace'),
+                                         (np.arange(0, 100, 3), 'arange'),
+                                         (np.arange(0.5, 10.0, 0.7), 'linspace'),  # evenly spaced floats
+                                         (np.geomspace(1, 1000, 4), 'geomspace')])
+def test_describe(value, kind):
+    spec = describe(value)
+    assert list(spec) == [kind]
+    expanded = expand({'g': [('x', spec, 'au')]})['g'][0][1]
+    assert expanded.dtype == value.dtype and np.allclose(expanded, value, rtol=1e-12)
+
+
+@pytest.mark.parametrize('value', [np.array([0, 1, 5, 6]), np.array([1.0, 2.0]), np.zeros((3, 3)),
+                                   np.array(['a', 'b', 'c']), [0, 1, 2 + 1j]])
+def test_describe_none(value):
+    assert describe(value) is None
+
+
+def test_compress_offset():
+    q0 = np.array([0.1, 0.35, 0.4, 0.9])  # not describable
+    loops = {'freq': [('Q0', q0, 'Hz'), ('Q1', q0 + 5e9, 'Hz'), ('Q2', np.linspace(0, 1, 5), 'Hz')]}
+    compressed = compress(loops)
+    assert compressed['freq'][0][1] is q0
+    assert compressed['freq'][1][1] == {'offset': ['Q0', 5e9]}
+    assert compressed['freq'][2][1] == {'linspace': [0.0, 1.0, 5]}
+
+    expanded = expand(compressed)
+    for (t, v, u), (_t, _v, _u) in zip(expanded['freq'], loops['freq']):
+        assert (t, u) == (_t, _u) and np.allclose(v, _v)
+
+
+@pytest.mark.parametrize('kind', ['load', 'fromfile', 'frombuffer', '__import__'])
+def test_expand_rejects_unknown(kind):
+    with pytest.raises(ValueError):
+        expand({'g': [('x', {kind: ['/etc/passwd']}, '')]})
+
+
+def test_assign_order():
+    rcp = Recipe('test')
+    rcp.define('freq', 'Q0', np.arange(3))
+    rcp.assign('a.b', 'freq.Q0')
+    rcp.assign('c.d', 0.1)
+    rcp.assign('a.b', 'freq.Q0')  # unchanged, stays in place
+    assert rcp.rules == ['⟨a.b⟩=⟨freq.Q0⟩', '⟨c.d⟩=0.1']
+    rcp.assign('a.b', 0.2)  # reassigned, applied last
+    assert rcp.rules == ['⟨c.d⟩=0.1', '⟨a.b⟩=0.2']
+
+
+def test_parse():
+    assert parse('⟨a.b⟩=⟨freq.Q0⟩') == ('a.b', 'freq.Q0', None)
+    assert parse('⟨a.b⟩=0.1') == ('a.b', None, 0.1)
+    assert parse('⟨a.b⟩="x=1"') == ('a.b', None, 'x=1')
+    assert parse('⟨a.b⟩=[1, 2]') == ('a.b', None, [1, 2])
+    assert parse('⟨a.b⟩=abc') == ('a.b', None, 'abc')
+
+
+def test_compile_gather():
+    loops = {'freq': [('Q0', np.arange(3) * 1.0, 'Hz'), ('$c.f', np.arange(3) * 2.0, 'Hz')],
+             'amp': [('Q0', np.array([0.1, 0.2]), 'au')]}
+    rules = ['⟨a.f⟩=⟨freq.Q0⟩', '⟨a.amp⟩=⟨amp.Q0⟩', '⟨a.x⟩=5']
+    compiled = compile_rules(rules, loops)
+    assert compiled == [('c.f', (0, 1), None),
+                        ('a.f', (0, 0), None),
+                        ('a.amp', (1, 0), None),
+                        ('a.x', None, 5)]
+
+    steps = np.array([[0, 0], [2, 1]])
+    values = gather(loops, compiled, steps)
+    assert values['a.f'].tolist() == [0.0, 2.0]
+    assert values['c.f'].tolist() == [0.0, 4.0]
+    assert values['a.amp'].tolist() == [0.1, 0.2]
+    assert values['a.x'] == 5
+
+
+@pytest.mark.parametrize('rule', ['⟨a.f⟩=⟨freq.Q1⟩', '⟨a.f⟩=⟨frq.Q0⟩'])
+def test_compile_undefined(rule):
+    loops = {'freq': [('Q0', np.arange(3) * 1.0, 'Hz')]}
+    with pytest.raises(KeyError):
+        compile_rules([rule], loops)
+    assert compile_rules(['⟨a.f⟩="frq.Q0"'], loops) == [('a.f', None, 'frq.Q0')]  # literal
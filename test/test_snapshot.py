@@ -0,0 +1,172 @@
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from quark.app import _db, _snapshot
+from quark.app._db import COLUMNS
+from quark.app._snapshot import (MISSING, HistoryIndex, SnapshotStore, changes, delta, digest, pack, patch,
+                                 unpack)
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    snapshots = {'c1': {'Q0': {'Measure': {'frequency': 6.5e9, 'mode': 'iq'}}},
+                 'c2': {'Q0': {'Measure': {'frequency': 6.6e9, 'mode': 'count'}}}}
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f'create table task ({", ".join(COLUMNS)})')
+    for i, commit in enumerate(['c1', 'c2', 'c1'], 1):
+        conn.execute(f'insert into task values ({", ".join("?" * len(COLUMNS))})',
+                     (i, 10**10 + i, 'test', 'baqis', 0, 'chip', 'Finished', 'a.hdf5', f'rec{i}',
+                      f'2026-01-0{i} 00:00:00', f'2026-01-0{i} 00:01:00', commit))
+    monkeypatch.setattr(_db, 'db', lambda: conn)
+    monkeypatch.setattr(_snapshot.store, 'resolve', lambda record: record[-1])
+    monkeypatch.setattr(_snapshot.store, 'load', lambda commit: snapshots[commit])
+    return HistoryIndex(tmp_path / 'history.db')
+
+
+def test_history_number(index):
+    h = index.history('Q0.Measure.frequency')
+    assert h['tid'].tolist() == [10**10 + 1, 10**10 + 2, 10**10 + 3]
+    assert h['value'].tolist() == [6.5e9, 6.6e9, 6.5e9]
+    assert h['text'].tolist() == [None] * 3
+
+
+def test_history_text(index):
+    h = index.history('Q0.Measure.mode', start='2026-01-02')
+    assert np.isnan(h['value']).all()
+    assert h['text'].tolist() == ["'count'", "'iq'"]
+
+
+def test_history_missing(index):
+    assert len(index.history('Q1.Measure.frequency')) == 0
+    assert 'Q1.Measure.frequency' in index.paths
+
+
+@pytest.fixture
+def stuck(tmp_path, monkeypatch):
+    """records of tid 1-4, the 2nd left running(never committed) by a crashed server"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f'create table task ({", ".join(COLUMNS)})')
+    monkeypatch.setattr(_db, 'db', lambda: conn)
+    monkeypatch.setattr(_snapshot.store, 'resolve', lambda record: record[-1])
+    monkeypatch.setattr(_snapshot.store, 'load', lambda commit: {'Q0': {'f': int(commit[1:])}})
+
+    def insert(i: int, status: str, created: str, commit: str):
+        conn.execute(f'insert into task values ({", ".join("?" * len(COLUMNS))})',
+                     (i, i, 'test', 'baqis', 0, 'chip', status, 'a.hdf5', f'rec{i}', created, '', commit))
+    index = HistoryIndex(tmp_path / 'history.db')
+    index.track('Q0.f')
+    return index, insert
+
+
+def test_history_stuck(stuck):
+    index, insert = stuck
+    for i, status in enumerate(['Finished', 'Running', 'Finished', 'Finished'], 1):
+        insert(i, status, f'2026-01-0{i} 00:00:00', '' if status == 'Running' else f'c{i}')
+    index.update()
+    assert index.history('Q0.f')['tid'].tolist() == [1, 3, 4]
+    assert index.paths['Q0.f'] == 4
+
+
+def test_history_running(stuck):
+    index, insert = stuck
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    insert(1, 'Finished', now, 'c1')
+    insert(2, 'Running', now, '')  # to be committed
+    insert(3, 'Finished', now, 'c3')
+    index.update()
+    assert index.history('Q0.f')['tid'].tolist() == [1]
+    assert index.paths['Q0.f'] == 1
+
+    index.update(grace=-1)  # given up
+    assert index.history('Q0.f')['tid'].tolist() == [1, 3]
+
+
+def test_digest():
+    a = {'x': 1, 'y': [1, 2.0, 'a'], 'z': np.arange(3)}
+    assert digest(a) == digest({'x': 1, 'y': [1, 2.0, 'a'], 'z': np.arange(3)})
+    assert digest(a) != digest({'x': 1.0, 'y': [1, 2.0, 'a'], 'z': np.arange(3)})
+    assert digest(a) != digest({'x': 1, 'y': (1, 2.0, 'a'), 'z': np.arange(3)})
+    assert digest(np.arange(3)) != digest(np.arange(3.0))
+
+
+def test_store_intern():
+    store = SnapshotStore()
+    a = store.intern({'Q0': {'f': 1, 'g': {'h': 2}}, 'Q1': {'f': 3}})
+    b = store.intern({'Q0': {'f': 1, 'g': {'h': 2}}, 'Q1': {'f': 4}})
+    assert a['Q0'] is b['Q0']  # shared subtree
+    assert a['Q1'] is not b['Q1']
+    assert a == {'Q0': {'f': 1, 'g': {'h': 2}}, 'Q1': {'f': 3}}
+
+    store = SnapshotStore(maxnodes=2)
+    store.intern({'a': {'b': 1}, 'c': {'d': 2}})
+    store.intern({'e': {'f': 3}})  # pool cleared
+    assert len(store.memo) <= 3
+
+
+def test_changes():
+    old = {'Q0': {'f': 1, 'g': {'h': 2}, 'a': np.arange(3)}, 'Q1': {'f': 3}, 'Q2': 5, 'unit': {'x': 1}}
+    new = {'Q0': {'f': 1, 'g': {'h': 4}, 'a': np.arange(3)}, 'Q1': 3, 'Q3': {'f': 6}, 'unit': {'x': 2}}
+    result = sorted(changes(new, old, ignore=['unit']), key=lambda c: c[0])
+    assert result == [('Q0.g.h', 2, 4),
+                      ('Q1', MISSING, 3),
+                      ('Q1.f', 3, MISSING),
+                      ('Q2', 5, MISSING),
+                      ('Q3.f', MISSING, 6)]
+    assert list(changes(old, old)) == []
+
+
+def test_changes_empty():
+    assert list(changes({'Q0': {'f': 1}, 'Q1': {}}, {'Q0': {'f': 1}})) == [('Q1', MISSING, {})]
+    assert list(changes({'Q0': {}}, {'Q0': {}, 'Q1': {}})) == [('Q1', {}, MISSING)]
+    assert list(changes({'Q0': {'a': {}}}, {'Q0': 5})) == [('Q0', 5, MISSING), ('Q0.a', MISSING, {})]
+    assert list(changes({'Q0': {}}, {'Q0': 5})) == [('Q0', 5, {})]
+
+
+def test_changes_leaves():
+    old = {'a': np.arange(3), 'b': [1, 2], 'c': 1}
+    new = {'a': np.arange(4), 'b': [1, 2], 'c': 1.0}
+    assert [c[0] for c in changes(new, old)] == ['a']
+
+
+def test_delta_patch():
+    old = {'Q0': {'f': 1, 'g': {'h': 2, 'i': 3}}, 'Q1': {'f': 3}, 'Q2': 5, 'a': np.arange(3)}
+    new = {'Q0': {'f': 1, 'g': {'h': 4, 'i': 3}}, 'Q1': 3, 'a': np.arange(3), 'Q3': {'f': 6}}  # new keys last
+    d = delta(new, old)
+    assert d == {'Q0': {'g': {'h': 4}}, 'Q1': 3, 'Q3': {'f': 6}, '$del': ['Q2']}
+    assert delta(old, old) == {}
+
+    result = patch(old, d)
+    assert digest(result) == digest(new)
+    assert result['Q0']['g'] is not old['Q0']['g']
+    assert old['Q0']['g']['h'] == 2 and 'Q2' in old  # not modified
+
+
+def test_pack():
+    base = {'Q0': {'f': 1}, 'Q1': {'f': 2}}
+    freq = np.linspace(-1, 1, 101)
+    tasks = [{'meta': {'other': {'lib': 'lib'}}, 'base': base,
+              'body': {'loop': {'freq': [('Q0.f', freq, 'Hz'), ('Q0.a', np.arange(3), 'au')]}, 'rule': []}},
+             {'meta': {'other': {'lib': 'lib'}}, 'base': base,
+              'body': {'loop': {'freq': [('Q1.f', freq.copy(), 'Hz')]}, 'rule': ['x']}}]
+    packed, refs = pack(tasks)
+    assert len(refs) == 3  # base, lib and freq(swept on different targets)
+    assert packed[0]['base'] == packed[1]['base'] == {'$ref': digest(base).hex()}
+    assert packed[0]['body']['loop']['freq'][0] == ('Q0.f', {'$ref': digest(freq).hex()}, 'Hz')
+    assert isinstance(packed[1]['body']['loop']['freq'][0][1], dict)
+    assert isinstance(packed[0]['body']['loop']['freq'][1][1], np.ndarray)  # not shared
+    assert packed[0]['body']['rule'] == []
+
+    assert tasks[0]['body']['loop']['freq'][0][1] is freq  # not modified
+    for task, p in zip(tasks, packed):
+        restored = unpack(p, refs)
+        assert digest(restored) == digest(task)
+        assert isinstance(restored['body']['loop']['freq'][0], tuple)
+
+
+def test_pack_nothing_shared():
+    tasks = [{'base': {'a': 1}}, {'base': {'a': 2}}]
+    packed, refs = pack(tasks)
+    assert refs == {} and packed == tasks and packed[0] is not tasks[0]
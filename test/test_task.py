@@ -0,0 +1,286 @@
+import time
+from collections import defaultdict
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from quark.app import submit_many
+from quark.app._snapshot import digest, patch, unpack
+from quark.app._task import Buffer, Task, TaskGroup, stack
+
+
+def test_buffer_preallocated():
+    buf = Buffer(capacity=10)
+    buf.extend([np.zeros(2), np.ones(2)])
+    view = buf[:]
+    buf.extend(np.full((3, 2), 2.0))
+    assert len(buf) == 5 and buf.capacity == 10
+    assert np.shares_memory(view, buf[:])  # filled in place
+    assert np.array_equal(np.asarray(buf)[:, 0], [0, 1, 2, 2, 2])
+
+
+def test_buffer_grows():
+    buf = Buffer()
+    for i in range(100):
+        buf.extend([i])
+    assert buf[:].tolist() == list(range(100))
+    assert buf.capacity < 200
+
+
+def test_buffer_promotes_dtype():
+    buf = Buffer(4)
+    buf.extend([1, 2])
+    buf.extend([1.5 + 1j])
+    assert buf[:].dtype == complex
+    assert buf[:].tolist() == [1, 2, 1.5 + 1j]
+
+
+def test_buffer_ragged():
+    buf = Buffer(8)
+    buf.extend([np.zeros(2), np.ones(2)])
+    buf.extend([np.ones(3)])
+    assert buf[:].dtype == object and len(buf) == 3
+
+    view = buf[:]
+    buf.extend(np.full((2, 2), 5.0))  # regular points after ragged ones
+    buf.extend([np.arange(4)])
+    assert np.shares_memory(view, buf[:])  # no reallocation
+    assert [len(v) for v in buf[:]] == [2, 2, 3, 2, 2, 4]
+    assert buf[3].tolist() == [5.0, 5.0]
+
+
+def test_stack():
+    assert stack([[1, 2], [3, 4]]).shape == (2, 2)
+    ragged = stack([[1, 2], [3]])
+    assert ragged.dtype == object and ragged.shape == (2,)
+    assert stack(np.zeros((2, 3)), ragged=True).shape == (2,)
+
+
+def test_task_arrays():
+    t = Task({'meta': {}})
+    t.meta = {'other': {'shape': [2, 3]}}
+    t.process([{'iq': 1.0}, {'iq': 2.0}])
+    assert isinstance(t.points['iq'], np.ndarray)
+
+    result = t.result()['data']['iq']
+    assert isinstance(result, np.ndarray) and result.shape == (2, 3)
+
+    t.process([{'iq': [1.0, 2.0]}])  # ragged, reshape fails
+    assert all(isinstance(v, np.ndarray) for v in t.result()['data'].values())
+
+
+class Server(object):
+    """server keeping the bases submitted, `$delta` is supported if **delta** is True"""
+
+    def __init__(self, delta: bool):
+        if delta:
+            self.delta = lambda ref: ref in self.bases
+        self.bases = {}
+        self.tasks = []
+
+    def submit(self, task: dict):
+        base = task['base']
+        if '$delta' in base:
+            d = base['$delta']
+            base = patch(self.bases[d['ref']], d['diff'])
+            assert digest(base).hex() == d['digest']
+        self.bases[digest(base).hex()] = deepcopy(base)
+        self.tasks.append(task)
+        return 10**10 + len(self.tasks)
+
+
+@pytest.fixture(autouse=True)
+def servers():
+    yield
+    Task.bases.clear()
+    Task.deltas.clear()
+    Task.streams.clear()
+    TaskGroup.batched.clear()
+
+
+def submit(server, base: dict):
+    t = Task({'meta': {}, 'body': {}, 'base': base})
+    t.server = server
+    t.run(delta=True)
+    return t
+
+
+def test_run_delta():
+    server = Server(delta=True)
+    base = {'Q0': {'f': 1, 'g': {'h': 2}}, 'Q1': {'f': list(range(100))}}
+    submit(server, base)
+    base = deepcopy(base)
+    base['Q0']['g']['h'] = 3
+    t = submit(server, base)
+    assert t.tid == 10**10 + 2
+    assert server.tasks[-1]['base']['$delta']['diff'] == {'Q0': {'g': {'h': 3}}}
+
+
+def test_run_delta_unsupported():
+    server = Server(delta=False)  # accepts anything, `delta` is unknown
+    base = {'Q0': {'f': 1}}
+    submit(server, base)
+    submit(server, {'Q0': {'f': 2}})
+    assert all('$delta' not in t['base'] for t in server.tasks)
+    assert Task.deltas[id(server)] is False
+
+
+class Batch(Server):
+    """server with `submit_many`, replying **reply** if given"""
+
+    def __init__(self, reply=None):
+        super().__init__(delta=False)
+        self.reply = reply
+
+    def submit_many(self, tasks: list[dict], refs: dict):
+        if self.reply is not None:
+            return self.reply
+        return [self.submit(unpack(task, refs)) for task in tasks]
+
+    def update(self, path: str, value):
+        pass
+
+
+def recipes(n: int = 3):
+    base = {'Q0': {'f': 1}}
+    return [{'meta': {}, 'body': {'loop': {'amp': [('Q0.a', np.arange(10), 'au')]}}, 'base': base}
+            for i in range(n)]
+
+
+def test_submit_many():
+    server = Batch()
+    handles = submit_many(recipes(), backend=server)
+    assert [t.tid for t in handles] == [10**10 + 1, 10**10 + 2, 10**10 + 3]
+    assert server.tasks[0]['base'] == {'Q0': {'f': 1}}
+
+
+@pytest.mark.parametrize('reply', ["AttributeError: 'Server' object has no attribute 'submit_many'",
+                                   'NotImplementedError: submit_many'])
+def test_submit_many_unsupported(reply):
+    server = Batch(reply)
+    handles = submit_many(recipes(), backend=server)
+    assert [t.tid for t in handles] == [10**10 + 1, 10**10 + 2, 10**10 + 3]
+
+    server = Server(delta=False)  # no such method
+    server.update = lambda path, value: None
+    assert len(submit_many(recipes(2), backend=server)) == len(server.tasks) == 2
+
+
+@pytest.mark.parametrize('reply', ['TimeoutError: timed out', [10**10 + 1]])
+def test_submit_many_failed(reply):
+    server = Batch(reply)
+    with pytest.raises(RuntimeError):
+        submit_many(recipes(), backend=server)
+    assert server.tasks == []  # never submitted twice
+
+
+def test_submit_many_raises():
+    server = Batch()
+    server.submit_many = lambda tasks, refs: 1 / 0  # e.g. transport error
+    with pytest.raises(ZeroDivisionError):
+        submit_many(recipes(), backend=server)
+    assert server.tasks == []
+
+
+class Runner(object):
+    """server producing 2 points of each task per request, `subscribe` and `poll` are optional"""
+
+    def __init__(self, subscribe: bool = True, poll: bool = False, size: int = 5):
+        self.size = size
+        self.produced = {}
+        self.calls = defaultdict(int)
+        if subscribe:
+            self.subscribe = self.__subscribe
+        if poll:
+            self.poll = self.__poll
+
+    def run(self, tid: int):
+        self.produced[tid] = min(self.produced.get(tid, 0) + 2, self.size)
+
+    def track(self, tid: int):
+        self.calls['track'] += 1
+        return {'status': 'Finished' if self.produced.get(tid, 0) == self.size else 'Running'}
+
+    def report(self, tid: int):
+        return {'size': self.size}
+
+    def fetch(self, tid: int, start: int = 0, meta: bool = False):
+        self.calls['fetch'] += 1
+        self.run(tid)
+        data = [{'iq': float(i)} for i in range(start, self.produced[tid])]
+        return data, ({'other': {'shape': [self.size]}} if meta else {})
+
+    def __subscribe(self, tid: int, start: int = 0, meta: bool = False, timeout: float = 0.0):
+        self.calls['subscribe'] += 1
+        data, meta = self.fetch(tid, start, meta)
+        return {'data': data, 'meta': meta} | self.track(tid)
+
+    def __poll(self, tasks: list[tuple]):
+        self.calls['poll'] += 1
+        return [self.__subscribe(*t) for t in tasks]
+
+
+def started(server, tid: int = 1, **kwds):
+    t = Task({'meta': {'name': 'test'}}, **kwds)
+    t.server, t.tid, t.stime = server, tid, time.time()
+    return t
+
+
+def test_subscribe():
+    server = Runner()
+    t = started(server)
+    assert t.poll() == 'Running'
+    assert t.meta == {'other': {'shape': [5]}} and t.points['iq'].tolist() == [0, 1]
+    assert Task.streams[id(server)] is True
+
+    t.timeout = 1e9  # blocking
+    t.bar(disable=True, interval=0.01)
+    assert t.state == 'Finished' and t.points['iq'].tolist() == [0, 1, 2, 3, 4]
+    assert server.calls['subscribe'] >= 3
+
+
+def test_subscribe_unsupported():
+    server = Runner(subscribe=False)
+    t = started(server, timeout=1e9)
+    assert t.subscribe() is None and Task.streams[id(server)] is False
+    t.bar(disable=True, interval=0.01)
+    assert t.state == 'Finished' and t.points['iq'].tolist() == [0, 1, 2, 3, 4]
+    assert server.calls['fetch'] >= 3 and 'subscribe' not in server.calls
+
+
+def test_backoff():
+    t = started(Runner())
+    assert t.backoff(1.0) == Task.mindelay
+    t.changed = False
+    assert [t.backoff(1.0) for _ in range(5)] == [0.2, 0.4, 0.8, 1.0, 1.0]
+    t.changed = True
+    assert t.backoff(1.0) == Task.mindelay
+
+
+def test_group_poll():
+    server = Runner(subscribe=False, poll=True)
+    group = TaskGroup([started(server, tid) for tid in range(1, 4)])
+    assert len(group) == 3 and group[2].tid == 2
+
+    assert group.tick(disable=True)
+    assert server.calls['poll'] == 1 and server.calls['fetch'] == 3  # one request for all
+    assert TaskGroup.batched[id(server)] is True
+
+    group.bar(interval=0.01, disable=True)
+    assert group.done == {1, 2, 3}
+    assert all(t.points['iq'].tolist() == [0, 1, 2, 3, 4] for t in group)
+    assert server.calls['poll'] == 3
+
+
+def test_group_unsupported():
+    servers = [Runner(), Runner(subscribe=False)]
+    group = TaskGroup([started(servers[0], 1), started(servers[1], 2)])
+    group.bar(interval=0.01, disable=True)
+    assert group.done == {1, 2}
+    assert TaskGroup.batched[id(servers[0])] is False
+    assert servers[0].calls['subscribe'] and not servers[1].calls['subscribe']
+    assert all(t.state == 'Finished' for t in group)
+
+    group.remove(1)
+    assert len(group) == 1 and group.done == {2}
@@ -0,0 +1,214 @@
+import time
+from collections import defaultdict
+from copy import deepcopy
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from quark.app import _viewer
+from quark.app._viewer import COLORS, PIXELS, Density, Viewer, block, decimate, plot, states
+
+
+class Conn(object):
+    """viewer recording the calls with the arguments as received"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwds: self.calls.append((name, *deepcopy(args)))
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = Conn()
+    monkeypatch.setattr(_viewer, 'connect', lambda *args, **kwds: conn)
+    monkeypatch.setattr(_viewer, 'ping', lambda conn: True)
+    return conn
+
+
+def wait(condition, timeout: float = 2.0):
+    stop = time.time() + timeout
+    while not condition() and time.time() < stop:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_first_check(conn):
+    viewer = Viewer(port=0)
+    assert viewer.healthy()  # fresh process, the first check is waited for
+    viewer.plot([{}])
+    assert wait(lambda: conn.calls == [('plot', [{}])])
+
+
+def test_first_check_dead(monkeypatch):
+    monkeypatch.setattr(_viewer, 'connect', lambda *args, **kwds: 1 / 0)
+    viewer = Viewer(port=0)
+    assert not viewer.healthy()
+    assert viewer.checked.is_set()
+
+
+def test_coalesce(monkeypatch):
+    monkeypatch.setattr(Viewer, 'start', lambda self: None)
+    viewer = Viewer(port=0)
+    for name in ['plot', 'clear', 'info', 'append', 'append', 'clear', 'plot']:
+        viewer.put(name)
+    assert [c[0] for c in viewer._Viewer__queue] == ['clear', 'info', 'clear', 'plot']
+
+
+def test_figure_cleared(conn, monkeypatch):
+    viewer = Viewer(port=0)
+    monkeypatch.setattr(_viewer, '_vs', {'viewer': viewer})
+    start = Viewer.start
+    monkeypatch.setattr(Viewer, 'start', lambda self: None)  # sent after the figure is cleared
+
+    fig = _viewer.Figure()
+    fig.clear()
+    ax, = fig.subplot(1)
+    ax.plot([1, 2, 3])
+    fig.show()
+    fig.clear()
+    start(viewer)
+    assert wait(lambda: len(conn.calls) == 3)
+    assert [c[0] for c in conn.calls] == ['clear', 'plot', 'clear']
+    cell, = conn.calls[1][1]
+    assert cell[1]['ydata'].tolist() == [1, 2, 3]
+
+
+def test_decimate():
+    x = np.arange(10000)
+    y = np.sin(x / 100)
+    y[1234] = 5  # spike
+    xd, yd = decimate(x, y, 100)
+    assert len(xd) == len(yd) <= 200
+    assert 5 in yd and y.min() == yd.min()
+    assert np.array_equal(yd, y[xd])
+
+    xd, yd = decimate(x[:150], y[:150], 100)
+    assert len(yd) == 150
+
+
+def test_block():
+    data = np.arange(24.0).reshape(2, 12)
+    assert block(data, 1) is data
+    assert block(data, 4).tolist() == [[1.5, 5.5, 9.5], [13.5, 17.5, 21.5]]
+    assert block(data, 5).shape == (2, 3)  # the last block padded by the edge
+    assert block(data.T, 4, axis=0).shape == (3, 2)
+
+
+def image(index: int, state: str = 'Running', **kwds):
+    """task of a 10x1000 grid, **index** points done"""
+    x, y = np.arange(10.0), np.linspace(0, 1, 1000)
+    data = np.repeat(np.arange(10.0), 1000)[:, None] + y[None].T.repeat(10, 1).T.reshape(-1, 1)
+    return SimpleNamespace(meta={'other': {'signal': 'S'}, 'axis': {'x': {'x': x}, 'y': {'y': y}}},
+                           data={'S': data}, name='test', state=state, index=index, last=0,
+                           counter=defaultdict(int), **kwds)
+
+
+def test_plot_image():
+    cell, = plot(image(10000), backend='')
+    line, = cell.values()
+    assert len(line['zdata']) == 10 * len(line['ydata'])
+    assert len(line['ydata']) <= PIXELS and len(line['xdata']) == 10
+    size = int(np.ceil(1000 / PIXELS))
+    assert np.allclose(line['zdata'][:len(line['ydata'])], line['ydata'])  # row 0 is y itself
+    assert np.allclose(line['ydata'][:2], [np.mean(np.linspace(0, 1, 1000)[i * size:(i + 1) * size])
+                                           for i in range(2)])
+
+
+class Canvas(Conn):
+    """viewer always ready"""
+
+    def __getattr__(self, name: str):
+        if name in ['healthy', 'ready']:
+            return lambda: True
+        return super().__getattr__(name)
+
+
+def test_plot_image_rows(monkeypatch):
+    canvas = Canvas()
+    monkeypatch.setattr(_viewer, '_vs', {'viewer': canvas})
+
+    task = image(2500, task={})
+    plot(task)
+    line, = canvas.calls[-1][1][0].values()
+    assert canvas.calls[-1][0] == 'plot'
+    assert len(line['zdata']) == 2 * len(line['ydata'])  # the partial row is kept for the next frame
+    assert task.drawn == 2000
+
+    task.index, task.last = 5000, 2500
+    plot(task, append=True)
+    assert canvas.calls[-1][0] == 'append'
+    assert len(canvas.calls[-1][1][0].popitem()[1]['zdata']) == 3 * len(line['ydata'])
+    assert task.drawn == 5000
+
+    task.index, task.last, task.state = 5500, 5000, 'Canceled'
+    plot(task, append=True)
+    zdata = canvas.calls[-1][1][0].popitem()[1]['zdata']
+    assert len(zdata) == len(line['ydata']) and np.isnan(zdata[-1])
+    assert task.drawn == 5500
+
+
+def test_density():
+    rng = np.random.default_rng(0)
+    shots = rng.normal(size=(2, 1000)) + 1j * rng.normal(size=(2, 1000))
+    hist = Density(bins=50)
+    hist.add(shots[0], 0)
+    hist.add(shots[1], 1)
+    hist.add(np.array([np.nan]), 1)
+    assert tuple(hist.shape) == (50, 50)
+    xc, yc, z = hist.image()
+    assert z.shape == (50, 50) and z.sum() == 2000
+    assert np.allclose(np.diff(xc), hist.width[0])
+
+    hist.add(np.array([100 + 0j]), 0)  # far outside, range extended and bins merged
+    xc, yc, z = hist.image()
+    assert z.sum() == 2001 and hist.shape[0] <= 100
+    assert xc[0] - hist.width[0] / 2 <= shots.real.min() and xc[-1] + hist.width[0] / 2 > 100
+    assert len(yc) == 50
+
+    xc, yc, z = hist.image(COLORS)
+    assert z.shape == (*hist.shape, 3) and z.dtype == np.uint8
+
+
+def test_density_incremental():
+    rng = np.random.default_rng(1)
+    shots = rng.normal(size=(4, 500)) + 1j * rng.normal(size=(4, 500))
+    shots[0, :2] = -10 - 10j, 10 + 10j  # range of the first frame
+    once, frames = Density(), Density()
+    once.add(shots, 0)
+    frames.add(shots[:2], 0)
+    frames.add(shots[2:], 0)  # binned alone
+    assert np.array_equal(once.image()[2], frames.image()[2])
+    assert frames.image()[2].sum() == shots.size
+
+
+def test_states():
+    task = SimpleNamespace(meta={'axis': {'state': {'Q0': np.array([0, 1, 2])}}})
+    assert states(task) == [0, 1, 2]
+    task.meta['axis'] = {'amp': {'Q0': np.array([0, 1, 2])}}  # not a state
+    assert states(task) is None
+    task.states = [1, 0, 1, 0]
+    assert states(task) == [1, 0, 1, 0]
+    task.states = [0, 5]  # no color
+    assert states(task) is None
+
+
+def test_plot_density(monkeypatch):
+    canvas = Canvas()
+    monkeypatch.setattr(_viewer, '_vs', {'viewer': canvas})
+    rng = np.random.default_rng(2)
+    data = (rng.normal(size=(5, 200, 1)) + 1j * rng.normal(size=(5, 200, 1))) + np.arange(5)[:, None, None]
+    task = SimpleNamespace(meta={'other': {'signal': 'iq'}, 'axis': {'state': {'Q0': np.arange(5) % 2}}},
+                           data={'iq': data}, name='test', index=2, last=0, task={},
+                           counter=defaultdict(int), progress=SimpleNamespace(total=1))
+    plot(task)
+    assert task.binned == 2 and task.hists[0].image()[2].sum() == 400
+    z = canvas.calls[-1][1][0]['density']['zdata']
+    assert z.ndim == 3 and z.dtype == np.uint8  # colored by the states
+
+    task.index, task.last = 5, 2
+    plot(task, append=True)
+    assert task.binned == 5 and task.hists[0].image()[2].sum() == 1000
+    assert set(task.hists[0].counts) == {0, 1}